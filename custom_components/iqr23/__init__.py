@@ -1,19 +1,55 @@
 """A Home Assistant integration for communication with IQ R23 heating controller."""
 
 import logging
+from functools import partial
+from time import perf_counter
 
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.start import async_at_started
+from homeassistant.helpers.storage import Store
 
-from .const import DOMAIN, PLATFORMS, MANUFACTURER, MODEL
+from .const import (
+    DOMAIN,
+    PLATFORMS,
+    MANUFACTURER,
+    MODEL,
+    CONF_MAX_CONCURRENCY,
+    DEFAULT_MAX_CONCURRENCY,
+    CONF_PARSER,
+    CONF_POLL_INTERVAL,
+    DEFAULT_POLL_INTERVAL,
+    CONF_SETTINGS_POLL_INTERVAL,
+    DEFAULT_SETTINGS_POLL_INTERVAL,
+    CONF_MAX_STALENESS,
+    DEFAULT_MAX_STALENESS,
+    CONF_EXTRA_REGISTERS,
+    CATALOG_STORAGE_KEY,
+    DATA_SCHEDULERS,
+    STORAGE_VERSION,
+)
 
-from .iqr23 import IQR23
+from .coordinator import IQR23Coordinator
+from .discovery import async_discover, scan_enabled
+from .iqr23 import IQR23, CATALOG_FILES, PARSER_XMLTODICT, SETTINGS_FILES, RegisterCatalog, StaggeredScheduler
 
 _LOGGER = logging.getLogger(__name__)
 
 
 async def async_setup(hass, config):
     hass.data.setdefault(DOMAIN, {})
+
+    async def discover(hass):
+        try:
+            await async_discover(hass)
+        except Exception as e:  # NOQA
+            _LOGGER.warning(f"Discovery of iQ R23 controllers failed: {e}")
+
+    if scan_enabled(hass):
+        # look for further controllers once the network settings are final
+        async_at_started(hass, discover)
     # we don't support YAML configuration, therefore just return True
     return True
 
@@ -22,8 +58,19 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
     hass.data.setdefault(DOMAIN, {})
 
     _LOGGER.info(f"Setup of IQR23 platform {entry.data}")
+    start = perf_counter()
 
-    api = IQR23(entry.data["host"])
+    poll_interval = entry.options.get(CONF_POLL_INTERVAL, DEFAULT_POLL_INTERVAL)
+    settings_poll_interval = entry.options.get(CONF_SETTINGS_POLL_INTERVAL, DEFAULT_SETTINGS_POLL_INTERVAL)
+    api = IQR23(
+        entry.data["host"],
+        max_concurrency=entry.options.get(CONF_MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY),
+        parser=entry.options.get(CONF_PARSER, PARSER_XMLTODICT),
+        poll_intervals={
+            file: settings_poll_interval if file in SETTINGS_FILES else poll_interval
+            for file in CATALOG_FILES
+        },
+    )
 
     # Store version info for device_info
     device_info = {
@@ -34,17 +81,127 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
         "sw_version": entry.data.get("version", "unknown"),
     }
 
-    hass.data[DOMAIN] = {
+    coordinator = IQR23Coordinator(
+        hass,
+        api,
+        _store(hass, entry),
+        max_staleness=entry.options.get(CONF_MAX_STALENESS, DEFAULT_MAX_STALENESS),
+    )
+    # entities start from the snapshot saved before the restart, the scheduler fetches fresh data
+    if not await coordinator.async_restore():
+        # one priming load, reusing the config flow's discovery response, feeds every entity
+        try:
+            await coordinator.async_config_entry_first_refresh()
+        except Exception:
+            await api.close()
+            raise
+
+    extra_registers = [key.strip() for key in entry.options.get(CONF_EXTRA_REGISTERS, "").split(",") if key.strip()]
+    version = api.state.get("_accvers") or entry.data.get("version")
+    try:
+        api.catalog = await _async_catalog(hass, api, version, build=bool(extra_registers))
+    except Exception as e:
+        _LOGGER.warning(f"Register catalog of {api.host} is not available: {e}")
+    if extra_registers:
+        api.addRegisters(extra_registers)
+        coordinator.async_set_updated_data(api.snapshot)
+
+    await _async_migrate_unique_ids(hass, entry, coordinator.controller_id)
+
+    hass.data[DOMAIN][entry.entry_id] = {
         "api": api,
+        "coordinator": coordinator,
         "device_info": device_info,
     }
+    _scheduler(hass, coordinator.poll_interval).add(entry.entry_id, coordinator.async_refresh)
+
+    async def async_stop(event=None):
+        _unschedule(hass, entry.entry_id, coordinator.poll_interval)
+        await api.close()
+
+    # entries are not unloaded when Home Assistant stops
+    entry.async_on_unload(async_stop)
+    entry.async_on_unload(hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_stop))
+    entry.async_on_unload(entry.add_update_listener(async_reload_entry))
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
-    _LOGGER.info(f"Setup of IQR23 platform {entry.data} done")
+    elapsed = perf_counter() - start
+    api.metrics.observe("setup_time", elapsed)
+    _LOGGER.info(f"Setup of IQR23 platform {entry.data} done in {elapsed:.3f}s")
     return True
 
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry):
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
     if unload_ok:
-        hass.data.pop(DOMAIN)
+        # polling stops and the session closes in the async_on_unload callbacks
+        hass.data[DOMAIN].pop(entry.entry_id)
     return unload_ok
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry):
+    await _store(hass, entry).async_remove()
+
+
+def _store(hass: HomeAssistant, entry: ConfigEntry) -> Store:
+    """Return the store keeping the last snapshot of the controller across restarts."""
+    return Store(hass, STORAGE_VERSION, f"{DOMAIN}.{entry.entry_id}")
+
+
+async def _async_catalog(hass: HomeAssistant, api: IQR23, version: str, build: bool) -> RegisterCatalog | None:
+    """Return the register catalog of this firmware version, building and caching it when build is set."""
+    store = Store(hass, STORAGE_VERSION, CATALOG_STORAGE_KEY)
+    catalogs = await store.async_load() or {}
+    if version in catalogs:
+        return RegisterCatalog.from_dict(catalogs[version])
+    if not build:
+        return None
+    catalog = await api.buildCatalog()
+    # keyed by the version reported while building, the firmware may have been updated meanwhile
+    catalogs[catalog.version] = catalog.as_dict()
+    await store.async_save(catalogs)
+    return catalog
+
+
+def _scheduler(hass: HomeAssistant, interval) -> StaggeredScheduler:
+    """Return the scheduler shared by all controllers polled at this interval."""
+    schedulers = hass.data.setdefault(DATA_SCHEDULERS, {})
+    if interval not in schedulers:
+        schedulers[interval] = StaggeredScheduler(interval, partial(_async_create_poll_task, hass, interval))
+    return schedulers[interval]
+
+
+def _async_create_poll_task(hass: HomeAssistant, interval, coroutine):
+    create_background_task = getattr(hass, "async_create_background_task", None)
+    if create_background_task is not None:
+        # background tasks are cancelled when Home Assistant stops, 2023.4 and newer
+        return create_background_task(coroutine, f"{DOMAIN} poll every {interval}s")
+    # a tracked task would hold up every async_block_till_done, on older cores the loop is
+    # left untracked and async_stop cancels it through _unschedule on unload and on stop
+    return hass.loop.create_task(coroutine)
+
+
+def _unschedule(hass: HomeAssistant, entry_id: str, interval):
+    schedulers = hass.data.get(DATA_SCHEDULERS, {})
+    if interval not in schedulers:
+        return
+    schedulers[interval].remove(entry_id)
+    if not schedulers[interval]:
+        del schedulers[interval]
+
+
+async def _async_migrate_unique_ids(hass: HomeAssistant, entry: ConfigEntry, controller_id: str):
+    """Move entities from the old iqr23_<uid> unique ids to per controller ones."""
+    prefix = f"{DOMAIN}_{controller_id}_"
+
+    @callback
+    def _migrate(entity_entry: er.RegistryEntry):
+        if entity_entry.unique_id.startswith(prefix):
+            return None
+        uid = entity_entry.unique_id[len(f"{DOMAIN}_"):]
+        return {"new_unique_id": f"{prefix}{uid}"}
+
+    await er.async_migrate_entries(hass, entry.entry_id, _migrate)
+
+
+async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry):
+    await hass.config_entries.async_reload(entry.entry_id)
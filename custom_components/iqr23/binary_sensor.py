@@ -1,8 +1,5 @@
-import asyncio
 import logging
-from datetime import timedelta
 
-import aiohttp
 from homeassistant.components.binary_sensor import (
     ENTITY_ID_FORMAT,
     BinarySensorDeviceClass,
@@ -11,46 +8,50 @@ from homeassistant.components.binary_sensor import (
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.util import dt as dt_util
 from .const import DOMAIN
-from .iqr23 import IQR23, SENSORS, Sensor
+from .coordinator import IQR23Coordinator
+from .entity import IQR23Entity
+from .iqr23 import Sensor
 
 _LOGGER = logging.getLogger(__name__)
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback) -> None:
-    api = hass.data[DOMAIN]["api"]
-    device_info = hass.data[DOMAIN]["device_info"]
+    coordinator = hass.data[DOMAIN][entry.entry_id]["coordinator"]
+    device_info = hass.data[DOMAIN][entry.entry_id]["device_info"]
 
     new_entities = []
-    for uid, sensor_info in SENSORS.items():
+    for uid, sensor_info in coordinator.api.sensors.items():
         if sensor_info.type != bool:
             continue
-        new_entities.append(IQR23BinarySensor(api, uid, sensor_info, device_info))
+        new_entities.append(IQR23BinarySensor(coordinator, uid, sensor_info, device_info))
 
     if new_entities:
-        async_add_entities(new_entities, update_before_add=True)
+        async_add_entities(new_entities)
 
-class IQR23BinarySensor(BinarySensorEntity):
+class IQR23BinarySensor(IQR23Entity, BinarySensorEntity):
 
-    def __init__(self, api: IQR23, uid: str, sensor_info: Sensor, device_info: dict):
-        super().__init__()
-        self._api = api
-        self._uid = uid
+    def __init__(self, coordinator: IQR23Coordinator, uid: str, sensor_info: Sensor, device_info: dict):
+        self._index = coordinator.api.plan.sensor_index[uid]
         self._sensor_info = sensor_info
-        self._device_info = device_info
-        self._attr_available = False
-        self._attr_has_entity_name = True
+        super().__init__(coordinator, uid, (sensor_info.name,), device_info)
+        # the first update is published whatever the publish interval
+        self._last_published = None
 
-    async def async_update(self) -> None:
-        try:
-            value = await self._api.getSensor(self._uid)
+    def _read(self):
+        return self.coordinator.data.values[self._index]
+
+    def _apply(self, value) -> None:
+        super()._apply(value)
+        if value is None:
+            self._attr_is_on = None
+        else:
             self._attr_is_on = (not value) if self._sensor_info.homeassistant_inversed else value
+        self._last_published = dt_util.utcnow()
 
-            #self._attr_extra_state_attributes = res["info"]
-            self._attr_available = True
-        except (asyncio.TimeoutError, aiohttp.ClientError, KeyError) as e:
-            _LOGGER.exception(e)
-            self._attr_available = False
+    def _changed(self, value) -> bool:
+        return self._sensor_info.should_publish(self._value, value, self._last_published, dt_util.utcnow())
 
     @property
     def name(self):
@@ -60,15 +61,6 @@ class IQR23BinarySensor(BinarySensorEntity):
     def friendly_name(self):
         return self._sensor_info.friendly_name
 
-    @property
-    def unique_id(self):
-        return f"iqr23_{self._uid}"
-
-    @property
-    def device_info(self):
-        # https://developers.home-assistant.io/docs/device_registry_index/#device-properties
-        return self._device_info
-
     @property
     def device_class(self):
         return self._sensor_info.homeassistant_class
@@ -0,0 +1,257 @@
+"""Command line poller of iQ R23 controllers, runs without Home Assistant."""
+import asyncio
+import json
+import logging
+import math
+import sys
+from functools import partial
+from time import time
+
+if __package__:
+    from .iqr23 import (
+        CONNECTION_LIMIT_PER_HOST,
+        DIGITAL_OUTPUTS,
+        DNS_CACHE_TTL,
+        FILES,
+        IQR23,
+        KEEPALIVE_TIMEOUT,
+        PARSER_STREAM,
+        PARSER_XMLTODICT,
+        POLL_INTERVALS,
+        SETTINGS_FILES,
+        StaggeredScheduler,
+    )
+else:
+    # run as a script from the integration directory, iqr23.py needs nothing of Home Assistant
+    from iqr23 import (
+        CONNECTION_LIMIT_PER_HOST,
+        DIGITAL_OUTPUTS,
+        DNS_CACHE_TTL,
+        FILES,
+        IQR23,
+        KEEPALIVE_TIMEOUT,
+        PARSER_STREAM,
+        PARSER_XMLTODICT,
+        POLL_INTERVALS,
+        SETTINGS_FILES,
+        StaggeredScheduler,
+    )
+
+_LOGGER = logging.getLogger(__name__)
+
+
+# connections open at once over a whole fleet, every host still gets at most its limit
+FLEET_CONNECTIONS = 256
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+def _jsonValue(value):
+    # NaN is not JSON, a missing probe reads as null
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def _metricValue(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, float) and not math.isfinite(value):
+        return "NaN" if math.isnan(value) else ("+Inf" if value > 0 else "-Inf")
+    if isinstance(value, (int, float)):
+        return value
+    return None
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class FleetPoller:
+    """Poll many controllers on one event loop.
+
+    The clients share one aiohttp session, whose connector caps the
+    connections of the whole fleet, and polls are spread over the interval
+    by a StaggeredScheduler. With an output stream given every new snapshot
+    and every failed poll is written to it as a JSON line, app() serves the
+    latest values of all controllers as OpenMetrics.
+    """
+
+    def __init__(self, hosts, interval=5, connections=FLEET_CONNECTIONS, parser=PARSER_STREAM, output=None):
+        self.hosts = list(dict.fromkeys(hosts))
+        self.interval = interval
+        self.connections = connections
+        self.parser = parser
+        self.output = output
+        self.clients = dict()
+        # last error of every controller whose last poll failed
+        self.errors = dict()
+        self._session = None
+        self._scheduler = None
+        self._runner = None
+
+    async def start(self):
+        import aiohttp
+        connector = aiohttp.TCPConnector(
+            limit=self.connections,
+            limit_per_host=CONNECTION_LIMIT_PER_HOST,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=DNS_CACHE_TTL,
+        )
+        self._session = aiohttp.ClientSession(connector=connector)
+        self._scheduler = StaggeredScheduler(self.interval)
+        poll_intervals = {file: self.interval for file in FILES if file not in SETTINGS_FILES}
+        for host in self.hosts:
+            api = IQR23(host, parser=self.parser, poll_intervals=poll_intervals, session=self._session)
+            self.clients[api.host] = api
+            self._scheduler.add(api.host, partial(self._poll, api))
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        for host, api in list(self.clients.items()):
+            self._scheduler.remove(host)
+            await api.close()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _poll(self, api):
+        try:
+            files = await api.loadIfRequired()
+        except Exception as e:
+            self.errors[api.host] = str(e) or type(e).__name__
+            _LOGGER.debug(f"Poll of {api.host} failed: {self.errors[api.host]}")
+            if self.output is not None:
+                self._write({"host": api.host, "time": time(), "error": self.errors[api.host]})
+            return
+        self.errors.pop(api.host, None)
+        if files and self.output is not None:
+            self._write(self.record(api))
+
+    def _write(self, record):
+        self.output.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self.output.flush()
+
+    @staticmethod
+    def record(api):
+        snapshot = api.snapshot
+        return {
+            "host": api.host,
+            "time": snapshot.loadtime,
+            "files": sorted(api.fileset),
+            "stale_files": sorted(snapshot.stale_files),
+            "sensors": {uid: _jsonValue(value) for uid, value in snapshot.sensors.items()},
+            "outputs": {uid: {"on": on, "mode": mode} for uid, (on, mode) in snapshot.outputs.items()},
+        }
+
+    def openMetrics(self):
+        """Return the latest values of all controllers in the OpenMetrics text format."""
+        snapshots = [(_label(host), api.snapshot) for host, api in self.clients.items()]
+        snapshots = [(host, snapshot) for host, snapshot in snapshots if snapshot is not None]
+        lines = [
+            "# TYPE iqr23_up gauge",
+            "# HELP iqr23_up Whether the last poll of the controller succeeded.",
+        ]
+        lines += [f'iqr23_up{{host="{_label(host)}"}} {int(api.snapshot is not None and host not in self.errors)}' for host, api in self.clients.items()]
+        lines += [
+            "# TYPE iqr23_requests counter",
+            "# HELP iqr23_requests HTTP requests sent to the controller.",
+        ]
+        lines += [f'iqr23_requests_total{{host="{_label(host)}"}} {api.requests}' for host, api in self.clients.items()]
+        lines += [
+            "# TYPE iqr23_last_load_timestamp_seconds gauge",
+            "# UNIT iqr23_last_load_timestamp_seconds seconds",
+        ]
+        lines += [f'iqr23_last_load_timestamp_seconds{{host="{host}"}} {snapshot.loadtime}' for host, snapshot in snapshots]
+        lines += [
+            "# TYPE iqr23_sensor gauge",
+            "# HELP iqr23_sensor Decoded sensor value, booleans as 0 or 1.",
+        ]
+        for host, snapshot in snapshots:
+            for uid, value in snapshot.sensors.items():
+                value = _metricValue(value)
+                if value is not None:
+                    lines.append(f'iqr23_sensor{{host="{host}",sensor="{uid}"}} {value}')
+        lines += [
+            "# TYPE iqr23_output_on gauge",
+            "# HELP iqr23_output_on Whether the digital output is switched on.",
+        ]
+        for host, snapshot in snapshots:
+            for uid, (on, mode) in snapshot.outputs.items():
+                if on is not None:
+                    lines.append(f'iqr23_output_on{{host="{host}",output="{uid}"}} {int(on)}')
+        lines += [
+            "# TYPE iqr23_output_mode stateset",
+            "# HELP iqr23_output_mode Mode of the digital output.",
+        ]
+        for host, snapshot in snapshots:
+            for uid, (on, mode) in snapshot.outputs.items():
+                if mode is None:
+                    continue
+                for state in DIGITAL_OUTPUTS[uid].control_get.values():
+                    lines.append(f'iqr23_output_mode{{host="{host}",output="{uid}",iqr23_output_mode="{state}"}} {int(state == mode)}')
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def app(self):
+        from aiohttp import web
+
+        async def metrics(request):
+            return web.Response(body=self.openMetrics().encode(), headers={"Content-Type": OPENMETRICS_CONTENT_TYPE})
+
+        app = web.Application()
+        app.router.add_get("/metrics", metrics)
+        return app
+
+    async def serve(self, address, port):
+        from aiohttp import web
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, address, port).start()
+
+
+async def _runFleet(args, hosts):
+    poller = FleetPoller(hosts, args.interval, args.connections, args.parser, None if args.metrics else sys.stdout)
+    await poller.start()
+    try:
+        if args.metrics:
+            address, _, port = args.metrics.rpartition(":")
+            await poller.serve(address or None, int(port))
+        # runs until interrupted
+        await asyncio.Event().wait()
+    finally:
+        await poller.stop()
+
+
+def main(argv=None):
+    """Poll controllers outside Home Assistant, `python cli.py --help` for usage."""
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="iqr23",
+        description="Poll iQ R23 controllers and print their values as JSON Lines, or serve them as OpenMetrics.",
+    )
+    parser.add_argument("hosts", nargs="*", metavar="HOST", help="controller host or URL")
+    parser.add_argument("-f", "--hosts-file", help="file with one host per line, # starts a comment")
+    parser.add_argument("-i", "--interval", type=float, default=POLL_INTERVALS["data"], help="seconds between polls of a controller")
+    parser.add_argument("-c", "--connections", type=int, default=FLEET_CONNECTIONS, help="connections open at once over all controllers")
+    parser.add_argument("-m", "--metrics", metavar="[ADDRESS:]PORT", help="serve /metrics instead of printing JSON Lines")
+    parser.add_argument("--parser", choices=(PARSER_STREAM, PARSER_XMLTODICT), default=PARSER_STREAM)
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every request and failure")
+    args = parser.parse_args(argv)
+
+    hosts = list(args.hosts)
+    if args.hosts_file:
+        with open(args.hosts_file) as f:
+            hosts += [line.split("#")[0].strip() for line in f if line.split("#")[0].strip()]
+    if not hosts:
+        parser.error("no controllers given")
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING, stream=sys.stderr)
+    try:
+        asyncio.run(_runFleet(args, hosts))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
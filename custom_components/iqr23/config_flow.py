@@ -1,29 +1,33 @@
 import logging
+from urllib.parse import urlparse
 
-from .iqr23 import IQR23
+from .discovery import async_configured_addresses, async_discover
+from .iqr23 import IQR23, PARSER_STREAM, PARSER_XMLTODICT
 
 import voluptuous as vol
 from homeassistant import config_entries, exceptions, core
+from homeassistant.core import callback
 from homeassistant.helpers.device_registry import format_mac
 
-#from skydance.network.discovery import discover_ips_by_mac
-from .const import DOMAIN
+from .const import (
+    DOMAIN,
+    CONF_MAX_CONCURRENCY,
+    DEFAULT_MAX_CONCURRENCY,
+    CONF_PARSER,
+    CONF_POLL_INTERVAL,
+    DEFAULT_POLL_INTERVAL,
+    CONF_SETTINGS_POLL_INTERVAL,
+    DEFAULT_SETTINGS_POLL_INTERVAL,
+    CONF_MAX_STALENESS,
+    DEFAULT_MAX_STALENESS,
+    CONF_EXTRA_REGISTERS,
+    CONF_SCAN_NETWORK,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
-DATA_SCHEMA = vol.Schema({vol.Required("host"): str})
-
-# TODO stub of auto-discovery follows:
-# async def _async_has_devices(hass) -> bool:
-#     """Return if there are devices that can be discovered."""
-#     local_ip = get_local_ip()
-#     # simply assume /24 network
-#     assumed_network_mask = "24"
-#     network = ipaddress.IPv4Network(local_ip + "/" + assumed_network_mask, strict=False)
-#     res = await discover_ips_by_mac(str(network.broadcast_address), broadcast=True)
-#     return len(res) > 0
-#
-# config_entry_flow.register_discovery_flow(DOMAIN, MANUFACTURER, _async_has_devices, config_entries.CONN_CLASS_ASSUMED)
+# an empty host searches the local networks
+DATA_SCHEMA = vol.Schema({vol.Optional("host", default=""): str})
 
 
 async def validate_input(hass: core.HomeAssistant, data: dict):
@@ -33,7 +37,15 @@ async def validate_input(hass: core.HomeAssistant, data: dict):
     Data has the keys from DATA_SCHEMA with values provided by the user.
     """
     if not data["host"]:
-        raise InvalidHost()
+        configured = await async_configured_addresses(hass)
+        found = {host: version for host, version in (await async_discover(hass)).items() if urlparse(host).hostname not in configured}
+        if not found:
+            raise CannotConnect()
+        if len(found) > 1:
+            # each of them is offered as a discovered flow
+            raise MultipleHosts()
+        data["host"], version = found.popitem()
+        return version
     try:
         host = data['host']
         _LOGGER.info(f"Trying to discover on {host}")
@@ -68,7 +80,8 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                     "version": discovery_result
                 }
                 _LOGGER.info("Adding iQ R23 config entry with data=%s", data)
-                await self.async_set_unique_id(host)
+                # takes over a discovered flow of the same controller
+                await self.async_set_unique_id(host, raise_on_progress=False)
                 self._abort_if_unique_id_configured()
                 return self.async_create_entry(title=host, data=data)
             except CannotConnect:
@@ -85,6 +98,77 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             step_id="user", data_schema=DATA_SCHEMA, errors=errors
         )
 
+    async def async_step_integration_discovery(self, discovery_info):
+        """Handle a controller found by a network scan."""
+        host = discovery_info["host"]
+        await self.async_set_unique_id(host)
+        self._abort_if_unique_id_configured()
+        if urlparse(host).hostname in await async_configured_addresses(self.hass):
+            # configured under another name
+            return self.async_abort(reason="already_configured")
+        self._discovered = discovery_info
+        self.context["title_placeholders"] = {"host": host}
+        return await self.async_step_confirm()
+
+    async def async_step_confirm(self, user_input=None):
+        """Confirm adding a discovered controller."""
+        host = self._discovered["host"]
+        if user_input is not None:
+            _LOGGER.info("Adding discovered iQ R23 config entry with data=%s", self._discovered)
+            return self.async_create_entry(title=host, data=dict(self._discovered))
+
+        self._set_confirm_only()
+        return self.async_show_form(
+            step_id="confirm",
+            description_placeholders={"host": host, "version": self._discovered["version"]},
+        )
+
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        return OptionsFlow()
+
+
+class OptionsFlow(config_entries.OptionsFlow):
+
+    async def async_step_init(self, user_input=None):
+        """Manage the polling options of a configured controller."""
+        if user_input is not None:
+            return self.async_create_entry(title="", data=user_input)
+
+        options = self.hass.config_entries.async_get_entry(self.handler).options
+        schema = vol.Schema({
+            vol.Optional(
+                CONF_POLL_INTERVAL,
+                default=options.get(CONF_POLL_INTERVAL, DEFAULT_POLL_INTERVAL),
+            ): vol.All(int, vol.Range(min=1, max=300)),
+            vol.Optional(
+                CONF_SETTINGS_POLL_INTERVAL,
+                default=options.get(CONF_SETTINGS_POLL_INTERVAL, DEFAULT_SETTINGS_POLL_INTERVAL),
+            ): vol.All(int, vol.Range(min=1, max=3600)),
+            vol.Optional(
+                CONF_MAX_CONCURRENCY,
+                default=options.get(CONF_MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY),
+            ): vol.All(int, vol.Range(min=1, max=4)),
+            vol.Optional(
+                CONF_PARSER,
+                default=options.get(CONF_PARSER, PARSER_XMLTODICT),
+            ): vol.In([PARSER_XMLTODICT, PARSER_STREAM]),
+            vol.Optional(
+                CONF_MAX_STALENESS,
+                default=options.get(CONF_MAX_STALENESS, DEFAULT_MAX_STALENESS),
+            ): vol.All(int, vol.Range(min=0, max=86400)),
+            vol.Optional(
+                CONF_EXTRA_REGISTERS,
+                default=options.get(CONF_EXTRA_REGISTERS, ""),
+            ): str,
+            vol.Optional(
+                CONF_SCAN_NETWORK,
+                default=options.get(CONF_SCAN_NETWORK, True),
+            ): bool,
+        })
+        return self.async_show_form(step_id="init", data_schema=schema)
+
 
 class CannotConnect(exceptions.HomeAssistantError):
     """Error to indicate we cannot connect."""
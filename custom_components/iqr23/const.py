@@ -1,4 +1,28 @@
 DOMAIN = "iqr23"
 MANUFACTURER = "IQ Topeni"
 MODEL = "iQ R23"
-PLATFORMS = ["sensor", "binary_sensor", "switch"]
\ No newline at end of file
+PLATFORMS = ["sensor", "binary_sensor", "switch"]
+DATA_SCHEDULERS = f"{DOMAIN}_schedulers"
+DATA_DISCOVERY = f"{DOMAIN}_discovery"
+# off in the options of any controller, the local networks are not scanned at startup
+CONF_SCAN_NETWORK = "scan_network"
+# local networks larger than this are scanned only around our own address
+SCAN_MIN_PREFIX = 24
+
+CONF_MAX_CONCURRENCY = "max_concurrency"
+DEFAULT_MAX_CONCURRENCY = 1
+CONF_PARSER = "parser"
+CONF_POLL_INTERVAL = "poll_interval"
+DEFAULT_POLL_INTERVAL = 5
+CONF_SETTINGS_POLL_INTERVAL = "settings_poll_interval"
+DEFAULT_SETTINGS_POLL_INTERVAL = 60
+CONF_MAX_STALENESS = "max_staleness"
+# seconds a snapshot persisted before a restart may be shown, 0 disables restoring
+DEFAULT_MAX_STALENESS = 3600
+STORAGE_VERSION = 1
+# comma separated register keys decoded as extra sensors, see RegisterCatalog
+CONF_EXTRA_REGISTERS = "extra_registers"
+# register catalogs of every firmware version seen, shared by all controllers
+CATALOG_STORAGE_KEY = f"{DOMAIN}.catalog"
+# the last snapshot is written at most once per this many seconds, and on shutdown
+STORAGE_SAVE_DELAY = 300
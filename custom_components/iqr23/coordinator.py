@@ -0,0 +1,83 @@
+import asyncio
+import logging
+from time import perf_counter, time
+from xml.parsers.expat import ExpatError
+
+import aiohttp
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+
+from .const import STORAGE_SAVE_DELAY
+from .iqr23 import IQR23, CircuitBreaker, CircuitOpenError, Snapshot
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class IQR23Coordinator(DataUpdateCoordinator[Snapshot]):
+    """Polls one controller with a single load per cycle and pushes the decoded snapshot to all entities."""
+
+    def __init__(self, hass: HomeAssistant, api: IQR23, store: Store | None = None, max_staleness: float = 0):
+        # no own timer, a StaggeredScheduler shared by all controllers drives the refreshes
+        super().__init__(hass, _LOGGER, name=f"iqr23 {api.host}", update_interval=None)
+        self.api = api
+        self.controller_id = api.host.split("://", 1)[-1]
+        # tick at the shortest file interval, each tick only fetches the files that are due
+        self.poll_interval = min(poll.base_interval for poll in api.polls.values())
+        # the last snapshot survives restarts through the store, see async_restore
+        self._store = store
+        self.max_staleness = max_staleness
+        self._save_pending = False
+
+    async def async_restore(self) -> bool:
+        """Publish the snapshot saved before the last shutdown if it is not older than max_staleness."""
+        if self._store is None or not self.max_staleness:
+            return False
+        stored = await self._store.async_load()
+        if not stored or time() - stored["loadtime"] > self.max_staleness:
+            return False
+        self.api.restore(stored)
+        self.async_set_updated_data(self.api.snapshot)
+        _LOGGER.debug(f"Restored the snapshot of {self.api.host} from {stored['loadtime']}")
+        return True
+
+    @callback
+    def _schedule_save(self) -> None:
+        # one pending write at a time, the store writes whatever is current when it fires
+        if self._store is not None and self.max_staleness and not self._save_pending:
+            self._save_pending = True
+            self._store.async_delay_save(self._data_to_save, STORAGE_SAVE_DELAY)
+
+    @callback
+    def _data_to_save(self) -> dict:
+        self._save_pending = False
+        return self.api.exportState()
+
+    async def _async_update_data(self) -> Snapshot:
+        try:
+            fetched = await self.api.loadIfRequired()
+        except (asyncio.TimeoutError, aiohttp.ClientError, CircuitOpenError, ExpatError, KeyError) as e:
+            if self.data is not None and self.api.breaker.state == CircuitBreaker.CLOSED:
+                # ride out single failures, once the breaker opens every entity goes unavailable together
+                return self.data
+            if self.data is not None and self.data.restored and time() - self.data.loadtime <= self.max_staleness:
+                # keep showing the restored snapshot until fresh data arrives or it gets too old
+                return self.data
+            raise UpdateFailed(f"Error communicating with {self.api.host}: {e}") from e
+        if not fetched and self.data is not None:
+            return self.data
+        self._schedule_save()
+        # load already published the new snapshot
+        return self.api.snapshot
+
+    @callback
+    def async_update_listeners(self) -> None:
+        start = perf_counter()
+        super().async_update_listeners()
+        self.api.metrics.observe("entity_update_time", perf_counter() - start)
+
+    async def async_set_output_mode(self, uid: str, mode: str) -> None:
+        await self.api.setDigitalOutputMode(uid, mode)
+        # setDigitalOutputMode rereads only the file holding the col4xx status and mode
+        # registers, publish the new snapshot right away and leave the rest to the next poll
+        self.async_set_updated_data(self.api.snapshot)
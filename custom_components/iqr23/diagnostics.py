@@ -0,0 +1,41 @@
+"""Diagnostics support for the iQ R23 integration."""
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+from .iqr23 import SENSORS
+
+# the title and unique id of an entry are its host too
+TO_REDACT = {"host", "title", "unique_id"}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict:
+    """Return runtime performance metrics of one controller."""
+    data = hass.data[DOMAIN][entry.entry_id]
+    api = data["api"]
+    coordinator = data["coordinator"]
+    return {
+        "entry": async_redact_data(entry.as_dict(), TO_REDACT),
+        "loadtime": api.loadtime,
+        "requests": api.requests,
+        "last_update_success": coordinator.last_update_success,
+        "circuit": api.breaker.as_dict(),
+        "host_limit": {"limit": api.limiter.limit, "active": api.limiter.active, "peak": api.limiter.peak},
+        "file_timings": api.file_timings,
+        "polls": {
+            file: {
+                "interval": poll.interval,
+                "base_interval": poll.base_interval,
+                "next": poll.next,
+                "loadtime": api.file_loadtimes.get(file),
+                "failures": poll.failures,
+            }
+            for file, poll in api.polls.items()
+        },
+        "stale_files": sorted(api.staleFiles()),
+        "last_batch": api.last_batch,
+        "catalog": None if api.catalog is None else {"version": api.catalog.version, "registers": len(api.catalog)},
+        "extra_registers": [uid for uid in api.sensors if uid not in SENSORS],
+        "metrics": api.metrics.as_dict(),
+    }
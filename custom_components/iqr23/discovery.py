@@ -0,0 +1,78 @@
+"""Discovery of iQ R23 controllers on the local networks."""
+
+import ipaddress
+import logging
+import socket
+from urllib.parse import urlparse
+
+from homeassistant.components import network
+from homeassistant.config_entries import SOURCE_INTEGRATION_DISCOVERY
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import discovery_flow
+
+from .const import CONF_SCAN_NETWORK, DATA_DISCOVERY, DOMAIN, SCAN_MIN_PREFIX
+from .iqr23 import IQR23
+
+_LOGGER = logging.getLogger(__name__)
+
+
+async def _async_networks(hass: HomeAssistant):
+    """Return the IPv4 networks of the adapters enabled in the network settings."""
+    networks = set()
+    for adapter in await network.async_get_adapters(hass):
+        if not adapter["enabled"]:
+            continue
+        for address in adapter["ipv4"]:
+            # larger networks are narrowed to the /24 around our own address
+            interface = ipaddress.ip_interface(f"{address['address']}/{max(address['network_prefix'], SCAN_MIN_PREFIX)}")
+            if interface.ip.is_loopback or interface.ip.is_link_local:
+                continue
+            networks.add(interface.network)
+    return sorted(networks)
+
+
+async def async_configured_addresses(hass: HomeAssistant):
+    """Return the host names and resolved addresses of every configured or ignored controller."""
+    addresses = set()
+    for entry in hass.config_entries.async_entries(DOMAIN):
+        host = urlparse(entry.data.get("host") or entry.unique_id or "").hostname
+        if not host:
+            continue
+        addresses.add(host)
+        try:
+            # an entry set up by host name would not match the scanned addresses
+            for *_, sockaddr in await hass.loop.getaddrinfo(host, None, type=socket.SOCK_STREAM):
+                addresses.add(sockaddr[0])
+        except OSError as e:
+            _LOGGER.debug(f"Cannot resolve {host}: {e}")
+    return addresses
+
+
+async def _async_scan(hass: HomeAssistant):
+    found = await IQR23.scan(await _async_networks(hass))
+    configured = await async_configured_addresses(hass)
+    for host, version in found.items():
+        if urlparse(host).hostname not in configured:
+            discovery_flow.async_create_flow(
+                hass,
+                DOMAIN,
+                context={"source": SOURCE_INTEGRATION_DISCOVERY},
+                data={"host": host, "version": version},
+            )
+    return found
+
+
+def scan_enabled(hass: HomeAssistant) -> bool:
+    """Return whether no configured controller turned the network scan off in its options."""
+    return all(entry.options.get(CONF_SCAN_NETWORK, True) for entry in hass.config_entries.async_entries(DOMAIN))
+
+
+async def async_discover(hass: HomeAssistant):
+    """Scan the local networks, start a discovered flow for every new controller and return all found.
+
+    Concurrent callers share one scan.
+    """
+    task = hass.data.get(DATA_DISCOVERY)
+    if task is None or task.done():
+        task = hass.data[DATA_DISCOVERY] = hass.async_create_task(_async_scan(hass))
+    return await task
@@ -0,0 +1,79 @@
+"""Base entity of the iQ R23 integration."""
+from homeassistant.core import callback
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+
+from .coordinator import IQR23Coordinator
+
+
+class IQR23Entity(CoordinatorEntity[IQR23Coordinator]):
+    """Entity showing a value decoded from controller registers.
+
+    Subclasses read their value from the snapshot in _read(), show it in
+    _apply() and tell in _usable() whether it can be shown at all. The
+    state is written only when the value, the availability or the restored
+    flag changed, or when _changed() asks for it.
+    """
+
+    _attr_has_entity_name = True
+
+    def __init__(self, coordinator: IQR23Coordinator, uid: str, keys: tuple, device_info: dict):
+        super().__init__(coordinator)
+        self._uid = uid
+        # registers read, the first one tells the file the value comes from
+        self._keys = keys
+        self._device_info = device_info
+        self._published_available = None
+        self._published_stale = None
+        self._value = None
+        self._apply(self._read())
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        # only files holding registers of enabled entities are polled
+        self.async_on_remove(self.coordinator.api.subscribe(self._keys))
+
+    def _read(self):
+        raise NotImplementedError
+
+    def _apply(self, value) -> None:
+        self._value = value
+
+    def _usable(self, value) -> bool:
+        return value is not None
+
+    def _changed(self, value) -> bool:
+        return value != self._value
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        value = self._read()
+        available = self.coordinator.last_update_success and self._usable(value) and not self._source_stale()
+        stale = self.coordinator.data.restored
+        if available == self._published_available and stale == self._published_stale and not self._changed(value):
+            return
+        self._apply(value)
+        self._published_available = available
+        self._published_stale = stale
+        super()._handle_coordinator_update()
+
+    @property
+    def available(self) -> bool:
+        return super().available and self._usable(self._value) and not self._source_stale()
+
+    def _source_stale(self) -> bool:
+        # the file this register comes from has not been fetched for too long
+        return self.coordinator.api.fileOf(self._keys[0]) in self.coordinator.data.stale_files
+
+    @property
+    def extra_state_attributes(self):
+        # values restored from before a restart until the first poll replaces them
+        return {"stale": True} if self.coordinator.data.restored else None
+
+    @property
+    def unique_id(self):
+        return f"iqr23_{self.coordinator.controller_id}_{self._uid}"
+
+    @property
+    def device_info(self):
+        # https://developers.home-assistant.io/docs/device_registry_index/#device-properties
+        return self._device_info
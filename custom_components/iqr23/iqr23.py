@@ -1,12 +1,25 @@
-import aiohttp
 import asyncio
-import xmltodict
-from enum import Enum
-from collections import namedtuple
-from time import time
+import hashlib
+import heapq
+import ipaddress
+import itertools
+import random
+from types import MappingProxyType
+from bisect import bisect_left
+from contextlib import asynccontextmanager, nullcontext
+from functools import partial
+from enum import Enum, IntEnum
+from xml.parsers import expat
+from collections import defaultdict, deque, namedtuple
+from time import perf_counter, time
 from datetime import datetime, timedelta
 
 import logging
+from typing import TYPE_CHECKING
+
+# aiohttp and xmltodict are imported where first used, importing this module stays cheap
+if TYPE_CHECKING:
+    import aiohttp
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -35,7 +48,7 @@ class HardwareDigitalOutput:
         self.control_get = control_get
 
 class Sensor:
-    def __init__(self, name, type, unit="", info="", convertor=None, friendly_name=None, homeassistant_class=None, homeassistant_sclass=None, homeassistant_inversed=False, homeassistant_icon=None, publish_time=0):
+    def __init__(self, name, type, unit="", info="", convertor=None, friendly_name=None, homeassistant_class=None, homeassistant_sclass=None, homeassistant_inversed=False, homeassistant_icon=None, publish_time=0, deadband=0):
         self.name = name
         self.friendly_name = friendly_name
         self.unit = unit
@@ -44,6 +57,7 @@ class Sensor:
 
         self.convertor = convertor
         self.publish_time = timedelta(seconds=publish_time)
+        self.deadband = deadband
 
         self.homeassistant_class = homeassistant_class
         self.homeassistant_inversed = homeassistant_inversed
@@ -62,6 +76,26 @@ class Sensor:
             return True
         return datetime.now() - self.last_published > self.publish_time
 
+    def changed(self, previous, value):
+        if previous is value:
+            return False
+        if previous is None or value is None:
+            return True
+        if previous != previous and value != value:
+            # both NaN, the sensor is still disconnected
+            return False
+        if self.deadband and self.type == float:
+            # NaN never falls within the deadband, so sensor dropouts always publish
+            return not abs(value - previous) <= self.deadband
+        return previous != value
+
+    def should_publish(self, previous, value, last_published, now=None):
+        if last_published is None:
+            return True
+        if not self.changed(previous, value):
+            return False
+        return (now or datetime.now()) - last_published >= self.publish_time
+
     def __repr__(self):
         return '<Value(name="{}", unit="{}", info="{}")>'.format(self.name, self.unit, self.info)
 
@@ -118,31 +152,31 @@ DIGITAL_OUTPUTS = {
 
 SENSORS = {
     "outdoorTemp": Sensor(type=float, name="txt113", unit="°C", convertor=parseTemperature, info="T13 teplota venkovního čidla", friendly_name="Outdoor teperature", homeassistant_sclass="measurement", homeassistant_class="temperature"),
-    "outdoorTempMin": Sensor(type=float, name="txt714", unit="°C", convertor=parseTemperature, info="Minimální teplota za posledních 24 hodin", friendly_name="Minimal day temp", homeassistant_class="temperature"),
-    "outdoorTempMax": Sensor(type=float, name="txt715", unit="°C", convertor=parseTemperature, info="Maximální teplota za posledních 24 hodin", homeassistant_class="temperature"),
-    "outdoorTempMean": Sensor(type=float, name="txt713", unit="°C", convertor=parseTemperature, info="Průměrná teplota za posledních 24 hodin", homeassistant_class="temperature"),
+    "outdoorTempMin": Sensor(type=float, name="txt714", unit="°C", convertor=parseTemperature, info="Minimální teplota za posledních 24 hodin", friendly_name="Minimal day temp", homeassistant_class="temperature", publish_time=300),
+    "outdoorTempMax": Sensor(type=float, name="txt715", unit="°C", convertor=parseTemperature, info="Maximální teplota za posledních 24 hodin", homeassistant_class="temperature", publish_time=300),
+    "outdoorTempMean": Sensor(type=float, name="txt713", unit="°C", convertor=parseTemperature, info="Průměrná teplota za posledních 24 hodin", homeassistant_class="temperature", publish_time=300),
 
     "watertankUpper": Sensor(type=float, name="txt101", unit="°C", convertor=parseTemperature, info="Teplota čidla T01 horní části zásobníku", friendly_name="Zásobník nahoře", homeassistant_class="temperature"),
     "watertankUpperRequest": Sensor(type=float, name="txt501", unit="°C", convertor=parseTemperature, info="Požadovaná teplota S1 horní části zásobníku", homeassistant_class="temperature"),
     "watertankUpperHeating": Sensor(type=bool, name="_ico101", info="Topná spirála SP1", convertor=lambda x: x=="1", homeassistant_class="heat", friendly_name="Topení zásobníku nahoře"),
-    "watertankUpperHeatingTime": Sensor(type=float, name="txt740", unit="h", info="Čas topení spirály SP1", convertor=sptime, friendly_name="Topení zásobníku nahoře čas", homeassistant_icon="mdi:clock"),
+    "watertankUpperHeatingTime": Sensor(type=float, name="txt740", unit="h", info="Čas topení spirály SP1", convertor=sptime, friendly_name="Topení zásobníku nahoře čas", homeassistant_icon="mdi:clock", publish_time=60),
     "watertankMiddle": Sensor(type=float, name="txt102", unit="°C", convertor=parseTemperature, info="Teplota čidla T02 střední části zásobníku", friendly_name="Zásobník střed", homeassistant_class="temperature"),
     "watertankLower": Sensor(type=float, name="txt106", unit="°C", convertor=parseTemperature, info="Teplota čidla T06 dolní části zásobníku", friendly_name="Zásobník dole", homeassistant_class="temperature"),
     "watertankLowerRequest": Sensor(type=float, name="txt502", unit="°C", convertor=parseTemperature, info="Požadovaná teplota S2 dolní části zásobníku"),
     "watertankLowerHeating": Sensor(type=bool, name="_ico102", info="Topná spirála SP2", convertor=lambda x: x=="1", homeassistant_class="heat", friendly_name="Topení zásobníku dole"),
-    "watertankLowerHeatingTime": Sensor(type=float, name="txt741", unit="h", info="Čas topení spirály SP2", convertor=sptime, friendly_name="Topení zásobníku dole čas", homeassistant_icon="mdi:clock"),
+    "watertankLowerHeatingTime": Sensor(type=float, name="txt741", unit="h", info="Čas topení spirály SP2", convertor=sptime, friendly_name="Topení zásobníku dole čas", homeassistant_icon="mdi:clock", publish_time=60),
     "watertankPressure": Sensor(type=bool, name="col202", info="Stav vstupu tlakového čidla, True = OK", homeassistant_class="problem", homeassistant_inversed=True, friendly_name="Tlak v systému"),
 
     "lowerFloor": Sensor(type=float, name="txt111", unit="°C", convertor=parseTemperature, info="T11 teplota čidla na výstupu ekvitermního okruhu TO1", friendly_name="Podlahovka přízemí", homeassistant_class="temperature"),
     "lowerFloorRequest": Sensor(type=float, name="txt520", unit="°C", convertor=parseTemperature, info="Požadovaná teplota ekvitermního okruhu TO1", homeassistant_class="temperature"),
-    "lowerFloorMixing": Sensor(type=float, name="txt521", unit="%", info="Velikost otevření třícestného směšovacího ventilu okruhu TO1 v procentech", convertor=lambda x: int(x[:-1]), friendly_name="Směšovač přízemí", homeassistant_icon="mdi:call-merge"),
+    "lowerFloorMixing": Sensor(type=float, name="txt521", unit="%", info="Velikost otevření třícestného směšovacího ventilu okruhu TO1 v procentech", convertor=lambda x: int(x[:-1]), friendly_name="Směšovač přízemí", homeassistant_icon="mdi:call-merge", deadband=2),
     "lowerFloorLimiting": Sensor(type=bool, name="col115", info="Útlum topného okruhu TO1, True=útlum aktivní", convertor=lambda x: x=="1"),
     "lowerFloorActive": Sensor(type=bool, name="col206", info="Vstup z prostorového termostatu TO1, True=požadavek top", convertor=lambda x: x=="1", friendly_name="Podlahové topení přízemí"),
     "lowerFloorCirculation": Sensor(type=bool, name="_ico107", info="Stav oběhového čerpadla topného okruhu TO1", convertor=lambda x: x=="3"),
 
     "upperFloor": Sensor(type=float, name="txt112", unit="°C", convertor=parseTemperature, info="T12 teplota čidla na výstupu ekvitermního okruhu TO2", friendly_name="Podlahovka patro", homeassistant_class="temperature"),
     "upperFloorRequest": Sensor(type=float, name="txt526", unit="°C", convertor=parseTemperature, info="Požadovaná teplota ekvitermního okruhu TO2", homeassistant_class="temperature"),
-    "upperFloorMixing": Sensor(type=float, name="txt527", unit="%", info="Velikost otevření třícestného směšovacího ventilu okruhu TO2 v procentech", convertor=lambda x: int(x[:-1]), friendly_name="Směšovač patro", homeassistant_icon="mdi:call-merge"),
+    "upperFloorMixing": Sensor(type=float, name="txt527", unit="%", info="Velikost otevření třícestného směšovacího ventilu okruhu TO2 v procentech", convertor=lambda x: int(x[:-1]), friendly_name="Směšovač patro", homeassistant_icon="mdi:call-merge", deadband=2),
     "upperFloorLimiting": Sensor(type=bool, name="col116", info="Útlum topného okruhu TO2, True=útlum aktivní", convertor=lambda x: x=="1"),
     "upperFloorActive": Sensor(type=bool, name="col207", info="Vstup z prostorového termostatu TO2, True=požadavek top", convertor=lambda x: x=="1", friendly_name="Podlahové topení patro"),
     "upperFloorCirculation": Sensor(type=bool, name="_ico108", info="Stav oběhového čerpadla topného okruhu TO2", convertor=lambda x: x=="3"),
@@ -163,92 +197,1355 @@ SENSORS = {
     #"datetime": Sensor(type=datetime, name="_acctime", info="Aktuální datum a čas", convertor=lambda x: datetime.strptime(x[3:], "%d.%m.%Y  %H:%M:%S"), homeassistant_class="date"),
 }
 
+class DecodePlan:
+    """SENSORS and DIGITAL_OUTPUTS compiled once into flat, index addressed tables.
+
+    Sensor values, output states and output modes get fixed positions, so a
+    decode is one pass over the state and entities just index the result.
+    """
+
+    def __init__(self, sensors, outputs):
+        self.sensor_uids = tuple(sensors)
+        self.sensor_index = {uid: index for index, uid in enumerate(self.sensor_uids)}
+        self.keys = tuple(sensor.name for sensor in sensors.values())
+        self.parsers = tuple(sensor.convertor or sensor.type for sensor in sensors.values())
+        self.output_uids = tuple(outputs)
+        self.output_index = {uid: index for index, uid in enumerate(self.output_uids)}
+        self.status_keys = tuple(output.status for output in outputs.values())
+        self.mode_keys = tuple(tuple(output.control_get.items()) for output in outputs.values())
+
+    def decode(self, state, loadtime, previous=None, version=0, restored=False, stale_files=frozenset()):
+        if previous is not None and previous.plan is not self:
+            # positions of another plan, nothing to reuse
+            previous = None
+        if previous is not None and previous.state is state:
+            # same merged state, only the load time moves on
+            return Snapshot(self, version, loadtime, state, previous.raws, previous.values, previous.states, previous.modes, restored, stale_files)
+        get = state.get
+        raws = tuple(get(key) for key in self.keys)
+        if previous is not None and previous.raws == raws:
+            values = previous.values
+        else:
+            previous_raws = previous.raws if previous is not None else ()
+            values = []
+            for index, raw in enumerate(raws):
+                if index < len(previous_raws) and previous_raws[index] == raw:
+                    # unchanged register, skip the conversion
+                    values.append(previous.values[index])
+                elif raw is None:
+                    values.append(None)
+                else:
+                    try:
+                        values.append(self.parsers[index](raw))
+                    except (ValueError, IndexError):
+                        values.append(None)
+            values = tuple(values)
+
+        states = tuple(get(key) == '1' for key in self.status_keys)
+        modes = []
+        for mode_keys in self.mode_keys:
+            for key, mode in mode_keys:
+                if get(key) == '1':
+                    modes.append(mode)
+                    break
+            else:
+                modes.append(None)
+        return Snapshot(self, version, loadtime, state, raws, values, states, tuple(modes), restored, stale_files)
+
+class Snapshot:
+    """One decoded poll cycle, every value taken from the same load and stamped with its loadtime.
+
+    Snapshots are never modified once built, a load publishes a new one with
+    the next version. values, states and modes are positional, see
+    DecodePlan.sensor_index and DecodePlan.output_index. A restored snapshot
+    comes from IQR23.restore() and holds values persisted before a restart.
+    stale_files lists the files whose last good data was too old at loadtime.
+    """
+
+    __slots__ = ("plan", "version", "loadtime", "state", "raws", "values", "states", "modes", "restored", "stale_files")
+
+    def __init__(self, plan, version, loadtime, state, raws, values, states, modes, restored=False, stale_files=frozenset()):
+        self.plan = plan
+        self.version = version
+        self.loadtime = loadtime
+        self.state = state
+        self.raws = raws
+        self.values = values
+        self.states = states
+        self.modes = modes
+        self.restored = restored
+        self.stale_files = stale_files
+
+    def sensor(self, uid):
+        return self.values[self.plan.sensor_index[uid]]
+
+    def output(self, uid):
+        index = self.plan.output_index[uid]
+        return self.states[index], self.modes[index]
+
+    @property
+    def sensors(self):
+        return dict(zip(self.plan.sensor_uids, self.values))
+
+    @property
+    def outputs(self):
+        return dict(zip(self.plan.output_uids, zip(self.states, self.modes)))
+
+PLAN = DecodePlan(SENSORS, DIGITAL_OUTPUTS)
+
+FILES = (
+    'data',
+    'data_i_all',
+    'data_t_zas',
+#    'data_n_zas',
+    'data_n_txo',
+)
+# Every file the controller serves. data_n_zas holds no register of SENSORS
+# and is only polled for extra registers, see IQR23.addRegisters.
+CATALOG_FILES = (
+    'data',
+    'data_i_all',
+    'data_t_zas',
+    'data_n_zas',
+    'data_n_txo',
+)
+
+PARSER_XMLTODICT = "xmltodict"
+PARSER_STREAM = "stream"
+
+def _wantedKeys():
+    keys = {"_accvers"}
+    keys.update(sensor.name for sensor in SENSORS.values())
+    for output in DIGITAL_OUTPUTS.values():
+        keys.add(output.status)
+        keys.update(output.control_get)
+    return frozenset(keys)
+
+# Every key the integration reads from the controller, the stream parser drops the rest
+WANTED_KEYS = _wantedKeys()
+
+# Base poll interval in seconds of every file. data carries the live readings,
+# data_t_zas and data_n_txo the settings and requested temperatures.
+POLL_INTERVALS = {
+    'data': 5,
+    'data_i_all': 5,
+    'data_t_zas': 60,
+    'data_n_zas': 60,
+    'data_n_txo': 60,
+}
+# How far the interval of an unchanged file may back off, as a multiple of its base
+POLL_MAX_FACTOR = {
+    'data': 3,
+    'data_i_all': 3,
+    'data_t_zas': 10,
+    'data_n_zas': 10,
+    'data_n_txo': 10,
+}
+POLL_BACKOFF = 2
+# A failed file is retried on its own after this many seconds, doubling per failure
+FILE_RETRY_DELAY = 5
+# Registers of a file count as stale once its last good data is older than
+# this many times the file's longest poll interval
+STALE_FACTOR = 3
+SETTINGS_FILES = ('data_t_zas', 'data_n_txo')
+
+# Inferred register types: (Sensor type, convertor)
+REGISTER_TYPES = {
+    "bool": (bool, lambda x: x == "1"),
+    "int": (int, None),
+    "float": (float, parseTemperature),
+    "str": (str, None),
+}
+
+def inferType(key, value):
+    if value is None:
+        return "str"
+    if key.startswith("col") and value in ("0", "1"):
+        return "bool"
+    if value == "--.-":
+        # disconnected temperature probe
+        return "float"
+    for name, type in (("int", int), ("float", float)):
+        try:
+            type(value)
+            return name
+        except ValueError:
+            pass
+    return "str"
+
+class RegisterCatalog:
+    """Every register a controller firmware serves: key -> (file, inferred type).
+
+    Built once per firmware version from full fetches of CATALOG_FILES, it
+    tells which file holds a key and turns any key into a Sensor.
+    """
+
+    def __init__(self, version, registers):
+        self.version = version
+        self.registers = registers
+
+    @classmethod
+    def build(cls, files):
+        registers = dict()
+        # later files win, as in the merged state
+        for file in CATALOG_FILES:
+            for key, value in (files.get(file) or {}).items():
+                registers[key] = (file, inferType(key, value))
+        return cls(files["data"].get("_accvers"), registers)
+
+    def __contains__(self, key):
+        return key in self.registers
+
+    def __len__(self):
+        return len(self.registers)
+
+    def fileOf(self, key):
+        register = self.registers.get(key)
+        return register[0] if register is not None else None
+
+    def sensor(self, key):
+        file, name = self.registers[key]
+        type, convertor = REGISTER_TYPES[name]
+        return Sensor(key, type, info=f"Register {key} of {file}.xml", convertor=convertor, friendly_name=key)
+
+    def as_dict(self):
+        return {"version": self.version, "registers": {key: list(register) for key, register in self.registers.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["version"], {key: tuple(register) for key, register in data["registers"].items()})
+
+class FilePoll:
+    """Adaptive poll interval of one file.
+
+    Every fetch with an unchanged content hash backs the interval off up to
+    max_interval, a changed file drops it back to the base interval.
+    """
+
+    def __init__(self, interval, max_interval):
+        self.base_interval = interval
+        self.max_interval = max(interval, max_interval)
+        self.interval = interval
+        self.hash = None
+        self.next = 0
+        self.failures = 0
+
+    def due(self, now):
+        return now >= self.next
+
+    def force(self):
+        self.next = 0
+
+    def fail(self, now):
+        """Schedule a retry of just this file, backing off while it keeps failing."""
+        self.failures += 1
+        self.next = now + min(FILE_RETRY_DELAY * POLL_BACKOFF ** (self.failures - 1), self.max_interval)
+
+    def update(self, digest, now):
+        self.failures = 0
+        if digest is not None and digest == self.hash:
+            self.interval = min(self.interval * POLL_BACKOFF, self.max_interval)
+        else:
+            self.interval = self.base_interval
+        self.hash = digest
+        self.next = now + self.interval
+
+# Consecutive failed loads before the client stops talking to the controller,
+# and the exponential retry delay bounds in seconds once it did
+BREAKER_THRESHOLD = 3
+BREAKER_BASE_DELAY = 5
+BREAKER_MAX_DELAY = 300
+BREAKER_JITTER = 0.2
+# a half open circuit whose probe has not finished by then lets another one through
+BREAKER_PROBE_TIMEOUT = 60
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of contacting a controller that keeps failing."""
+
+class CircuitBreaker:
+    """Fails fast while a controller is unreachable.
+
+    After threshold consecutive failures the circuit opens and every call is
+    rejected until the retry delay passes. Then a single probe is let through
+    (half open): success closes the circuit, failure opens it again with the
+    delay doubled, up to max_delay, randomized by jitter so many clients do
+    not retry in lockstep. A probe that is aborted, or still running after
+    probe_timeout, gives way to a new one.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, threshold=BREAKER_THRESHOLD, base_delay=BREAKER_BASE_DELAY, max_delay=BREAKER_MAX_DELAY, jitter=BREAKER_JITTER, probe_timeout=BREAKER_PROBE_TIMEOUT, seed=None):
+        self.name = name
+        self.probe_timeout = probe_timeout
+        self.threshold = threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.retry_at = 0
+        self._random = random.Random(seed)
+
+    def allow(self, now):
+        if self.state == self.CLOSED:
+            return True
+        if now >= self.retry_at:
+            # the probe, or its replacement when the last one never finished
+            self.state = self.HALF_OPEN
+            self.retry_at = now + self.probe_timeout
+            return True
+        # open, or half open with the probe still running
+        return False
+
+    def abort(self, now):
+        """Give up a running probe without counting it, the next call probes again."""
+        if self.state == self.HALF_OPEN:
+            self.state = self.OPEN
+            self.retry_at = now
+
+    def success(self):
+        if self.state != self.CLOSED:
+            _LOGGER.info(f"{self.name} is reachable again")
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+
+    def failure(self, now, error=None):
+        self.failures += 1
+        if self.state == self.CLOSED and self.failures < self.threshold:
+            return
+        delay = min(self.base_delay * 2 ** self.opened, self.max_delay)
+        delay *= 1 + self._random.uniform(-self.jitter, self.jitter)
+        if self.state == self.CLOSED:
+            _LOGGER.info(f"{self.name} is unreachable after {self.failures} failures, retrying in {delay:.0f}s: {error}")
+        self.state = self.OPEN
+        self.opened += 1
+        self.retry_at = now + delay
+
+    def as_dict(self):
+        return {"state": self.state, "failures": self.failures, "retry_at": self.retry_at}
+
 DEFAULT_PASSWORD = {
     AccessLevel.LOGOUT: "",
     AccessLevel.USER: "1234",
     AccessLevel.MASTER: "Servis254"
 }
 
-async def getXml(url: str):
-    try:
+# The controller's embedded web server copes badly with parallel connections,
+# so every client keeps a single pooled keep-alive connection to its host.
+CONNECTION_LIMIT_PER_HOST = 1
+KEEPALIVE_TIMEOUT = 15
+DNS_CACHE_TTL = 300
+REQUEST_TIMEOUT = 10
+STREAM_CHUNK_SIZE = 4096
+# Output mode changes requested within this many seconds are applied in one batch
+COMMAND_WINDOW = 0.2
+# A discovery response younger than this primes the first load of the same host
+DISCOVERY_TTL = 30
+_discovered = dict()
+# network scans probe this many hosts at once, a silent address costs at most the timeout
+SCAN_CONCURRENCY = 64
+SCAN_CONNECT_TIMEOUT = 0.5
+SCAN_TIMEOUT = 2
+# discovery requests in flight, by URL, each dropped as it lands
+_inflight = dict()
+# limiters of the hosts someone talks to, dropped with the last client of a host
+_limiters = dict()
+
+
+class HostLimiter:
+    """Cap the requests in flight to one host, over every client and discovery of it."""
+
+    def __init__(self, limit=CONNECTION_LIMIT_PER_HOST):
+        self.limit = limit
+        self.active = 0
+        self.peak = 0
+        self._waiters = deque()
+        # limits claimed by the clients of the host, the largest one holds
+        self._claims = []
+        # a lower limit waiting for the requests in flight to finish
+        self._lowered = None
+
+    @property
+    def idle(self):
+        return not self._claims and not self.active and not self._waiters
+
+    def claim(self, limit):
+        self._claims.append(limit)
+        self._setLimit(max(self._claims))
+
+    def unclaim(self, limit):
+        self._claims.remove(limit)
+        self._setLimit(max(self._claims, default=CONNECTION_LIMIT_PER_HOST))
+
+    def _setLimit(self, limit):
+        if limit < self.limit and self.active:
+            # never lowered under requests in flight, release() lowers it once the host is idle
+            self._lowered = limit
+            return
+        self._lowered = None
+        raised = limit > self.limit
+        self.limit = limit
+        if raised:
+            for _ in range(limit):
+                self._wake()
+
+    async def acquire(self):
+        while self.active >= self.limit:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # woken but gone, pass the free slot on
+                    self._wake()
+                raise
+            finally:
+                self._waiters.remove(waiter)
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+
+    def release(self):
+        self.active -= 1
+        if self._lowered is not None and not self.active:
+            self.limit, self._lowered = self._lowered, None
+        self._wake()
+
+    def _wake(self):
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+def hostLimiter(host, limit=None):
+    """Return the HostLimiter of a host, a given limit is claimed until releaseHostLimiter()."""
+    limiter = _limiters.get(host)
+    if limiter is None:
+        limiter = _limiters[host] = HostLimiter()
+    if limit is not None:
+        limiter.claim(limit)
+    return limiter
+
+
+def releaseHostLimiter(host, limit=None):
+    """Give up a limit claimed by hostLimiter(), the limiter is dropped once nobody uses it."""
+    limiter = _limiters.get(host)
+    if limiter is None:
+        return
+    if limit is not None:
+        limiter.unclaim(limit)
+    if limiter.idle:
+        del _limiters[host]
+
+
+async def singleFlight(calls, key, factory, metrics=None):
+    """Await factory() once for all concurrent callers with the same key.
+
+    Callers share the result or the exception. A cancelled caller leaves
+    the request running for the others.
+    """
+    future = calls.get(key)
+    if future is None:
+        future = calls[key] = asyncio.ensure_future(factory())
+        future.add_done_callback(partial(_landed, calls, key))
+    elif metrics is not None:
+        metrics.inc("coalesced")
+    return await asyncio.shield(future)
+
+
+def _landed(calls, key, future):
+    if calls.get(key) is future:
+        del calls[key]
+    if not future.cancelled():
+        # retrieved here, every caller may have been cancelled
+        future.exception()
+
+class StreamParser:
+    """Incremental expat parser keeping only the wanted children of <response>.
+
+    Character data is only collected while inside a wanted element, everything
+    else is skipped by expat without building any Python objects for it.
+    """
+
+    def __init__(self, wanted):
+        self.wanted = wanted
+        self.result = dict()
+        self._depth = 0
+        self._current = None
+        self._chunks = []
+        self._parser = expat.ParserCreate()
+        self._parser.buffer_text = True
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+
+    def _start(self, name, attrs):
+        self._depth += 1
+        if self._depth == 1 and name != "response":
+            raise KeyError("response")
+        if self._depth == 2 and name in self.wanted:
+            self._current = name
+            self._parser.CharacterDataHandler = self._chunks.append
+
+    def _end(self, name):
+        if self._depth == 2 and self._current is not None:
+            # same value xmltodict yields for a leaf element
+            self.result[self._current] = "".join(self._chunks).strip() or None
+            self._chunks.clear()
+            self._current = None
+            self._parser.CharacterDataHandler = None
+        self._depth -= 1
+
+    def feed(self, data):
+        self._parser.Parse(data, False)
+
+    def close(self):
+        self._parser.Parse(b"", True)
+        # the handlers reference self, drop the parser to free it right away
+        self._parser = None
+        return self.result
+
+def parseXml(data, wanted=None):
+    if wanted is None:
+        import xmltodict
+        return xmltodict.parse(data)["response"]
+    parser = StreamParser(wanted)
+    parser.feed(data)
+    return parser.close()
+
+class Histogram:
+    """Latency histogram with fixed buckets in seconds."""
+
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.last = None
+
+    def observe(self, value):
+        self.counts[bisect_left(self.BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.last = value
+        if value > self.max:
+            self.max = value
+
+    def as_dict(self):
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip(self.BUCKETS + ("+Inf",), self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "max": self.max,
+            "last": self.last,
+            "buckets": buckets,
+        }
+
+class Metrics:
+    """Counters and latency histograms of one controller client, keyed by name."""
+
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.histograms = defaultdict(Histogram)
+
+    def inc(self, name, value=1):
+        self.counters[name] += value
+
+    def observe(self, name, seconds):
+        self.histograms[name].observe(seconds)
+
+    def total(self, prefix):
+        return sum(value for name, value in self.counters.items() if name.startswith(prefix))
+
+    def ratio(self, part, whole):
+        """Return counter part as a percentage of counter whole, None before the first count."""
+        if not self.counters.get(whole):
+            return None
+        return round(100 * self.counters.get(part, 0) / self.counters[whole], 1)
+
+    def as_dict(self):
+        return {
+            "counters": dict(self.counters),
+            "histograms": {name: histogram.as_dict() for name, histogram in self.histograms.items()},
+        }
+
+async def getXml(url: str, session: "aiohttp.ClientSession" = None, wanted=None):
+    if session is None:
+        import aiohttp
         async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=aiohttp.ClientTimeout(total=10)) as response:
-                if response.status != 200:
-                    raise aiohttp.ClientError(f"HTTP {response.status}")
-                text = await response.text()
-                responseXML = xmltodict.parse(text)["response"]
-                return responseXML
+            return await getXml(url, session, wanted)
+    responseXML, _ = await fetchXml(url, session, wanted)
+    return responseXML
+
+class CachedResponse:
+    """Last response of one URL: parsed data, body digest and the validators for conditional requests."""
+
+    __slots__ = ("data", "digest", "etag", "last_modified")
+
+    def __init__(self):
+        self.data = None
+        self.digest = None
+        self.etag = None
+        self.last_modified = None
+
+    def headers(self):
+        headers = dict()
+        if self.data is not None:
+            if self.etag:
+                headers["If-None-Match"] = self.etag
+            if self.last_modified:
+                headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+async def fetchXml(url: str, session: "aiohttp.ClientSession", wanted=None, metrics=None, label=None, cache=None, recorder=None):
+    """Return the parsed response together with a digest of its raw body.
+
+    With metrics given, network time, parse time and bytes received are
+    recorded under the label. With a CachedResponse given the request is
+    conditional, and a 304 or a body with the cached digest returns the
+    cached data without parsing. A recorder is called with the raw body,
+    or None for a 304.
+    """
+    import aiohttp
+    digest = hashlib.blake2b(digest_size=16)
+    start = perf_counter()
+    parse_time = 0.0
+    size = 0
+    reused = False
+    try:
+        headers = cache.headers() if cache is not None else None
+        async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)) as response:
+            if response.status == 304 and headers:
+                responseXML, reused = cache.data, True
+                digest = None
+                if recorder is not None:
+                    recorder(None)
+            elif response.status != 200:
+                raise aiohttp.ClientError(f"HTTP {response.status}")
+            elif cache is not None and cache.data is not None:
+                # whole body first, an unchanged one is not parsed at all
+                body = await response.read()
+                size = len(body)
+                digest.update(body)
+                if recorder is not None:
+                    recorder(body)
+                if digest.digest() == cache.digest:
+                    responseXML, reused = cache.data, True
+                else:
+                    parse_start = perf_counter()
+                    responseXML = parseXml(body.decode(response.get_encoding()) if wanted is None else body, wanted)
+                    parse_time = perf_counter() - parse_start
+            elif wanted is None:
+                body = await response.read()
+                size = len(body)
+                digest.update(body)
+                if recorder is not None:
+                    recorder(body)
+                parse_start = perf_counter()
+                responseXML = parseXml(body.decode(response.get_encoding()))
+                parse_time = perf_counter() - parse_start
+            else:
+                parser = StreamParser(wanted)
+                chunks = [] if recorder is not None else None
+                async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                    size += len(chunk)
+                    digest.update(chunk)
+                    if chunks is not None:
+                        chunks.append(chunk)
+                    parse_start = perf_counter()
+                    parser.feed(chunk)
+                    parse_time += perf_counter() - parse_start
+                parse_start = perf_counter()
+                responseXML = parser.close()
+                parse_time += perf_counter() - parse_start
+                if chunks is not None:
+                    recorder(b"".join(chunks))
+            if cache is not None:
+                cache.etag = response.headers.get("ETag", cache.etag)
+                cache.last_modified = response.headers.get("Last-Modified", cache.last_modified)
+        digest = cache.digest if digest is None else digest.digest()
+        if cache is not None:
+            cache.data, cache.digest = responseXML, digest
+        if metrics is not None:
+            metrics.observe(f"fetch_time.{label}", perf_counter() - start - parse_time)
+            metrics.observe(f"parse_time.{label}", parse_time)
+            metrics.inc(f"bytes.{label}", size)
+            metrics.inc("responses")
+            if reused:
+                metrics.inc("parses_skipped")
+        return responseXML, digest
     except asyncio.TimeoutError:
-        _LOGGER.error(f"Timeout while fetching {url}")
+        # outages are reported once by the client's CircuitBreaker
+        _LOGGER.debug(f"Timeout while fetching {url}")
         raise
     except Exception as e:
-        _LOGGER.error(f"Error fetching XML from {url}: {e}")
+        _LOGGER.debug(f"Error fetching XML from {url}: {e}")
         raise
 
+class Priority(IntEnum):
+    """Request classes of the RequestScheduler, lower goes first."""
+    CONTROL = 0
+    VERIFY = 1
+    POLL = 2
+
+class Superseded(Exception):
+    """A queued request was replaced by a newer one with the same key."""
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """A queued request did not get its turn before its deadline."""
+
+class ClientClosed(Exception):
+    """The client was closed before the request was sent."""
+
+class RequestScheduler:
+    """Hands the controller to one request at a time, highest priority first.
+
+    request() queues a ticket, a future resolved when it is that request's
+    turn. A ticket with a deadline (event loop time) fails with
+    DeadlineExceeded if it is still queued then, and queuing a ticket with a
+    key fails the older queued ticket with that key with Superseded. The
+    holder calls release() when done, which hands over to the next ticket.
+    """
+
+    def __init__(self):
+        self._busy = False
+        self._queue = []
+        self._order = itertools.count()
+        self._keys = dict()
+
+    def __len__(self):
+        return sum(1 for *_, future, _ in self._queue if not future.done())
+
+    def request(self, priority=Priority.POLL, deadline=None, key=None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if key is not None:
+            older = self._keys.pop(key, None)
+            if older is not None and not older.done():
+                older.set_exception(Superseded(key))
+        if not self._busy:
+            self._busy = True
+            future.set_result(None)
+            return future
+        if key is not None:
+            self._keys[key] = future
+        heapq.heappush(self._queue, (priority, next(self._order), future, key))
+        if deadline is not None:
+            handle = loop.call_at(deadline, self._expire, future)
+            future.add_done_callback(lambda _: handle.cancel())
+        return future
+
+    def _expire(self, future):
+        if not future.done():
+            future.set_exception(DeadlineExceeded())
+
+    async def wait(self, ticket):
+        try:
+            await ticket
+        except asyncio.CancelledError:
+            # granted just before the waiter was cancelled, pass the turn on
+            if ticket.done() and not ticket.cancelled() and ticket.exception() is None:
+                self.release()
+            raise
+
+    def release(self):
+        while self._queue:
+            _, _, future, key = heapq.heappop(self._queue)
+            if key is not None and self._keys.get(key) is future:
+                del self._keys[key]
+            # superseded, expired and cancelled tickets are skipped
+            if not future.done():
+                future.set_result(None)
+                return
+        self._busy = False
+
 class IQR23:
     @staticmethod
     async def discovery(host: str):
         if not host.startswith('http'):
             host =  'http://'+host
 
+        async def fetch():
+            import aiohttp
+            try:
+                async with hostLimiter(host).slot(), aiohttp.ClientSession() as session:
+                    return await fetchXml(f'{host}/data.xml', session)
+            finally:
+                releaseHostLimiter(host)
+
         try:
-            response = await getXml(f'{host}/data.xml')
+            response, digest = await singleFlight(_inflight, host, fetch)
+            now = time()
+            # responses no client picked up in time are of no use anymore
+            for stale in [key for key, (at, *_) in _discovered.items() if now - at >= DISCOVERY_TTL]:
+                del _discovered[stale]
+            # the client set up right after the config flow starts from this response
+            _discovered[host] = (now, response, digest)
             return response["_accvers"]
         except Exception as e:
             _LOGGER.error(f"Discovery failed for {host}: {e}")
             return None
 
-    def __init__(self, host: str, user_pass=None, master_pass=None):
+    @staticmethod
+    async def scan(networks, port=None, concurrency=SCAN_CONCURRENCY, timeout=SCAN_TIMEOUT):
+        """Probe every host of the given networks for a controller.
+
+        Returns the URL and firmware version of every host whose data.xml
+        carries an _accvers. Only that first element is read.
+        """
+        import aiohttp
+        suffix = f":{port}" if port else ""
+        urls = dict.fromkeys(
+            f"http://{address}{suffix}"
+            for network in networks
+            for address in ipaddress.ip_network(network, strict=False).hosts()
+        )
+        found = dict()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def probe(session, url):
+            # a controller already polled keeps its connection limit
+            limiter = _limiters.get(url)
+            async with semaphore, limiter.slot() if limiter else nullcontext():
+                try:
+                    async with session.get(f"{url}/data.xml") as response:
+                        if response.status != 200:
+                            return
+                        parser = StreamParser({"_accvers"})
+                        async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                            parser.feed(chunk)
+                            if "_accvers" in parser.result:
+                                break
+                except (asyncio.TimeoutError, aiohttp.ClientError, OSError, expat.ExpatError, KeyError):
+                    return
+            version = parser.result.get("_accvers")
+            if version:
+                found[url] = version
+
+        start = perf_counter()
+        connector = aiohttp.TCPConnector(limit=concurrency, force_close=True)
+        client_timeout = aiohttp.ClientTimeout(total=timeout, sock_connect=SCAN_CONNECT_TIMEOUT)
+        async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+            await asyncio.gather(*(probe(session, url) for url in urls))
+        _LOGGER.debug(f"Scanned {len(urls)} hosts in {perf_counter() - start:.1f}s, found {found}")
+        return found
+
+    def __init__(self, host: str, user_pass=None, master_pass=None, keepalive=True, max_concurrency=1, parser=PARSER_XMLTODICT, command_window=COMMAND_WINDOW, poll_intervals=None, session=None, recorder=None, transport=None):
         self.host = host if host.startswith('http') else 'http://'+host
         self.password = {
             AccessLevel.LOGOUT: DEFAULT_PASSWORD[AccessLevel.LOGOUT],
             AccessLevel.USER: user_pass if user_pass else DEFAULT_PASSWORD[AccessLevel.USER],
             AccessLevel.MASTER: master_pass if master_pass else DEFAULT_PASSWORD[AccessLevel.MASTER]
         }
-        self.state = dict()
+        self.state = MappingProxyType({})
         self.loadtime = 0
-        self._sequential_lock = asyncio.Lock()
+        # current Snapshot, replaced as a whole on every load so readers never see a half merged state
+        self.snapshot = None
+        self._published = asyncio.Event()
+        self._refreshTask = None
+        # one request at a time, user control ahead of verification reads ahead of polls
+        self.scheduler = RequestScheduler()
+        self.metrics = Metrics()
+        # HTTP requests sent to the controller, for round trip accounting
+        self.requests = 0
+        self.command_window = command_window
+        self._pendingModes = dict()
+        self._commandTask = None
+        # background refreshes and command batches, cancelled by close()
+        self._tasks = set()
+        self._closed = False
+        self.last_batch = None
+        self._keepalive = keepalive
+        # a session given by the caller is shared with other clients, it is not closed here
+        self._session = session
+        self._sharedSession = session is not None
+        # max_concurrency > 1 fetches FILES in parallel, at most that many at once
+        self.max_concurrency = max(1, max_concurrency)
+        # the same cap holds for every request to the host, whoever sends it, until close()
+        self._limit = max(CONNECTION_LIMIT_PER_HOST, self.max_concurrency)
+        self.limiter = hostLimiter(self.host, self._limit)
+        # file reads in flight, concurrent reads of a file share one request
+        self._inflight = dict()
+        # a recording.ResponseRecorder keeping every raw response, and a
+        # recording.ReplayTransport answering file reads in place of the controller
+        self.recorder = recorder
+        self.transport = transport
+        # start of the running load, the time its responses are recorded at
+        self._cycle = None
+        self.file_timings = dict()
+        self.parser = parser
+        # last parsed content and raw body digest of every file
+        self.files = dict()
+        self.file_hashes = dict()
+        # per file validators and parse result, unchanged responses are not parsed again
+        self.responses = defaultdict(CachedResponse)
+        self._intervals = dict(POLL_INTERVALS, **(poll_intervals or {}))
+        # files polled, in merge order, and what is decoded from them; addRegisters extends both
+        self.fileset = FILES
+        self.polls = {file: self._filePoll(file) for file in FILES}
+        self.sensors = SENSORS
+        self.plan = PLAN
+        self.wanted = WANTED_KEYS
+        self.catalog = None
+        # reference counts of the registers read by subscribers, None until the first
+        # subscription, which means every file is polled
+        self.subscriptions = None
+        self._planned = None
+        self._keyFiles = None
+        # time of the last successful fetch of every file
+        self.file_loadtimes = dict()
+        # state restored from before a restart, standing in for files not fetched since
+        self._restored = None
+        self.breaker = CircuitBreaker(f"iQ R23 at {self.host}")
+        # a poll still queued after the shortest interval is dropped, the next tick replaces it
+        self.poll_deadline = min(poll.base_interval for poll in self.polls.values())
+
+    def _filePoll(self, file):
+        interval = self._intervals[file]
+        return FilePoll(interval, interval * POLL_MAX_FACTOR[file])
+
+    async def buildCatalog(self):
+        """Fetch every file the controller serves in full and return its RegisterCatalog."""
+        files = dict()
+        async with self._exclusive(Priority.POLL):
+            for file in CATALOG_FILES:
+                self.requests += 1
+                async with self.limiter.slot():
+                    files[file], _ = await fetchXml(f"{self.host}/{file}.xml", self._getSession(), None, self.metrics, file)
+        catalog = RegisterCatalog.build(files)
+        _LOGGER.debug(f"Catalog of {self.host} firmware {catalog.version}: {len(catalog)} registers")
+        return catalog
+
+    def addRegisters(self, keys):
+        """Decode the given catalog registers as extra sensors, named by their key.
+
+        Files holding them are polled from now on. Keys missing from the
+        catalog are skipped with a warning.
+        """
+        sensors = dict(SENSORS)
+        for key in keys:
+            if self.catalog is None or key not in self.catalog:
+                _LOGGER.warning(f"Register {key} is not served by {self.host}")
+                continue
+            sensors.setdefault(key, self.catalog.sensor(key))
+        files = set(FILES) | {self.catalog.fileOf(sensor.name) for uid, sensor in sensors.items() if uid not in SENSORS}
+        self.fileset = tuple(file for file in CATALOG_FILES if file in files)
+        for file in self.fileset:
+            if file not in self.polls:
+                self.polls[file] = self._filePoll(file)
+        self.sensors = sensors
+        self.plan = DecodePlan(sensors, DIGITAL_OUTPUTS)
+        self.wanted = WANTED_KEYS | {sensor.name for sensor in sensors.values()}
+        self._planned = None
+        self._keyFiles = None
+        # cached parses miss the new keys
+        self.responses.clear()
+        if self.snapshot is not None:
+            # entities index the new plan, republish what is known right away
+            self._publish(self.state, self.loadtime, self.snapshot.restored, self.snapshot.stale_files)
+
+    def _getSession(self):
+        if self._sharedSession:
+            return self._session
+        if self._session is None or self._session.closed:
+            if self._closed:
+                # a session opened now would never be closed
+                raise ClientClosed(f"{self.host} client is closed")
+            import aiohttp
+            if self._keepalive:
+                keepalive = {"keepalive_timeout": KEEPALIVE_TIMEOUT}
+            else:
+                keepalive = {"force_close": True}
+            connector = aiohttp.TCPConnector(
+                limit_per_host=self.limiter.limit,
+                ttl_dns_cache=DNS_CACHE_TTL,
+                **keepalive,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def _spawn(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def close(self):
+        self._closed = True
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        # a batch cancelled while applying still logs out over the open session
+        await asyncio.gather(*tasks, return_exceptions=True)
+        pending, self._pendingModes = self._pendingModes, dict()
+        for _, futures in pending.values():
+            for future in futures:
+                if not future.done():
+                    future.set_exception(ClientClosed(f"{self.host} client is closed"))
+        if self._limit is not None:
+            releaseHostLimiter(self.host, self._limit)
+            self._limit = None
+        if self._sharedSession:
+            return
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @asynccontextmanager
+    async def _exclusive(self, priority=Priority.POLL, deadline=None, key=None, ticket=None):
+        start = perf_counter()
+        if ticket is None:
+            ticket = self.scheduler.request(priority, deadline, key)
+        await self.scheduler.wait(ticket)
+        wait = perf_counter() - start
+        self.metrics.observe("lock_wait", wait)
+        self.metrics.observe(f"lock_wait.{priority.name.lower()}", wait)
+        try:
+            yield
+        finally:
+            self.scheduler.release()
 
     async def loadFile(self, file):
-        return await getXml(f"{self.host}/{file}.xml")
+        primed = _discovered.pop(self.host, None) if file == 'data' else None
+        if primed is not None and time() - primed[0] < DISCOVERY_TTL:
+            _, file_data, self.file_hashes[file] = primed
+            self.metrics.inc("primed")
+            return file_data
+        return await singleFlight(self._inflight, file, partial(self._fetchFile, file), self.metrics)
+
+    async def _fetchFile(self, file):
+        wanted = self.wanted if self.parser == PARSER_STREAM else None
+        if self.transport is not None:
+            return self._replayFile(file, await self.transport.fetch(file), wanted)
+        recorder = None
+        if self.recorder is not None:
+            recorder = partial(self.recorder.append, file, timestamp=self._cycle or time())
+        try:
+            async with self.limiter.slot():
+                self.requests += 1
+                file_data, self.file_hashes[file] = await fetchXml(
+                    f"{self.host}/{file}.xml", self._getSession(), wanted, self.metrics, file, self.responses[file], recorder
+                )
+        except Exception:
+            self.metrics.inc(f"errors.{file}")
+            raise
+        return file_data
     
-    async def load(self):
-        #_LOGGER.warning(f"Loading....")
-        files = (
-            'data',
-            'data_i_all',
-            'data_t_zas',
-        #    'data_n_zas',
-            'data_n_txo',
-        )
+    def _replayFile(self, file, body, wanted):
+        # the same digest short-circuit as fetchXml, parse time is what a replay measures
+        cache = self.responses[file]
+        digest = hashlib.blake2b(body, digest_size=16).digest()
+        parse_start = perf_counter()
+        if digest == cache.digest and cache.data is not None:
+            self.metrics.inc("parses_skipped")
+        else:
+            cache.data, cache.digest = parseXml(body, wanted), digest
+        self.metrics.observe(f"parse_time.{file}", perf_counter() - parse_start)
+        self.metrics.inc(f"bytes.{file}", len(body))
+        self.metrics.inc("responses")
+        self.file_hashes[file] = digest
+        return cache.data
+
+    async def _timedLoadFile(self, file):
+        start = perf_counter()
+        file_data = await self.loadFile(file)
+        self.file_timings[file] = perf_counter() - start
+        return file_data
+
+    async def _loadConcurrently(self, files):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def fetch(file):
+            async with semaphore:
+                return await self._timedLoadFile(file)
+
+        tasks = [asyncio.ensure_future(fetch(file)) for file in files]
+        try:
+            # a failed file does not stop the others
+            return await asyncio.gather(*tasks, return_exceptions=True)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
 
-        self.state = dict()
+    def subscribe(self, keys):
+        """Register the keys a subscriber reads and return the callable dropping them again."""
+        keys = tuple(keys)
+        if self.subscriptions is None:
+            self.subscriptions = defaultdict(int)
+        for key in keys:
+            self.subscriptions[key] += 1
+        self._planned = None
+
+        def unsubscribe():
+            for key in keys:
+                self.subscriptions[key] -= 1
+                if not self.subscriptions[key]:
+                    del self.subscriptions[key]
+            self._planned = None
+        return unsubscribe
+
+    def plannedFiles(self):
+        """Return the polled files holding a subscribed register.
+
+        Without subscriptions every file is polled. Until every file was
+        fetched once and without a catalog, a key of unknown origin keeps
+        its candidate files in the plan.
+        """
+        if self._planned is None:
+            if self.subscriptions is None:
+                self._planned = self.fileset
+            else:
+                files = set()
+                unknown = any(file not in self.files for file in self.fileset)
+                for key in self.subscriptions:
+                    file = self.fileOf(key)
+                    if file is not None:
+                        files.add(file)
+                    elif unknown:
+                        files.update(file for file in self.fileset if file not in self.files)
+                self._planned = tuple(file for file in self.fileset if file in files)
+            _LOGGER.debug(f"Polling {self._planned} of {self.host}")
+        return self._planned
+
+    def dueFiles(self, now=None):
+        now = time() if now is None else now
+        return tuple(file for file in self.plannedFiles() if self.polls[file].due(now))
+
+    def forceFiles(self, files):
         for file in files:
-            file_data = await self.loadFile(file)
-            self.state.update(file_data)
+            self.polls[file].force()
 
+    def filesFor(self, keys):
+        """Return the files holding the given registers, all polled files while one of them is unknown."""
+        files = set()
+        for key in keys:
+            file = self.fileOf(key)
+            if file is None:
+                return self.fileset
+            files.add(file)
+        return tuple(file for file in self.fileset if file in files)
 
-    async def loadIfRequired(self):
+    def fileOf(self, key):
+        """Return the file a register comes from, by the catalog or else by the files fetched so far."""
+        if self.catalog is not None and key in self.catalog:
+            return self.catalog.fileOf(key)
+        if self._keyFiles is None:
+            # merged in fileset order, the last file holding a key wins
+            self._keyFiles = {key: file for file in self.fileset for key in self.files.get(file, ())}
+        return self._keyFiles.get(key)
+
+    def staleFiles(self, now=None):
+        """Return the files whose last good data is older than their stale threshold."""
+        now = time() if now is None else now
+        return frozenset(
+            file for file, loadtime in self.file_loadtimes.items()
+            if now - loadtime > STALE_FACTOR * self.polls[file].max_interval
+        )
+
+    async def _fetchFiles(self, files):
+        """Fetch the files and return the parsed and the failed ones, by file."""
+        import aiohttp
+        fetched = dict()
+        failed = dict()
+        if self.max_concurrency > 1:
+            for file, result in zip(files, await self._loadConcurrently(files)):
+                if isinstance(result, BaseException):
+                    failed[file] = result
+                else:
+                    fetched[file] = result
+        else:
+            for file in files:
+                try:
+                    fetched[file] = await self._timedLoadFile(file)
+                except Exception as e:
+                    failed[file] = e
+                    if isinstance(e, (asyncio.TimeoutError, aiohttp.ClientConnectionError)):
+                        # the controller is not answering, the other files would only wait for the timeout too
+                        break
+        return fetched, failed
+
+    async def load(self, files=None):
+        """Fetch the given files, by default those whose poll interval elapsed, and return them."""
+        #_LOGGER.warning(f"Loading....")
         now = time()
-        async with self._sequential_lock:
-            if self.loadtime + 5 < now:
-                await self.load() 
-                self.loadtime = now
+        if files is None:
+            files = self.dueFiles(now)
+        if not files:
+            return files
+        if not self.breaker.allow(now):
+            self.metrics.inc("circuit_rejected")
+            raise CircuitOpenError(f"{self.host} unreachable, next attempt in {self.breaker.retry_at - now:.0f}s")
+        start = perf_counter()
+        self._cycle = now
+        try:
+            fetched, failed = await self._fetchFiles(files)
+        except BaseException:
+            # cancelled, neither success nor failure of a probe is known
+            self.breaker.abort(time())
+            raise
+        finally:
+            self._cycle = None
+
+        # every failed file keeps its last good data and is retried on its own
+        for file in failed:
+            self.polls[file].fail(now)
+        if not fetched:
+            error = next(iter(failed.values()))
+            self.metrics.inc("load_errors")
+            self.breaker.failure(time(), error)
+            raise error
+        self.breaker.success()
+        if failed:
+            self.metrics.inc("partial_loads")
+            _LOGGER.debug(f"Loading {tuple(failed)} from {self.host} failed: {failed}")
+        files = tuple(fetched)
 
+        # unchanged responses hand back the very same parsed dict
+        changed = self.snapshot is None or any(file_data is not self.files.get(file) for file, file_data in fetched.items())
+        for file, file_data in fetched.items():
+            self.file_loadtimes[file] = now
+            if file not in self.files:
+                # first sight of its registers, the plan may change
+                self._planned = None
+                self._keyFiles = None
+            self.files[file] = file_data
+            self.polls[file].update(self.file_hashes.get(file), now)
+
+        if changed:
+            # merge in fileset order so overlapping keys resolve the same way every cycle
+            state = dict(self._restored or {})
+            for file in self.fileset:
+                state.update(self.files.get(file, {}))
+            state = MappingProxyType(state)
+        else:
+            state = self.state
+        if self._restored is not None and all(file in self.files for file in self.plannedFiles()):
+            self._restored = None
+        self._publish(state, now, self._restored is not None, self.staleFiles(now))
+        elapsed = perf_counter() - start
+        self.metrics.inc("loads")
+        self.metrics.observe("cycle_time", elapsed)
+        _LOGGER.debug(f"Loaded {files} from {self.host} in {elapsed:.3f}s, per file: {self.file_timings}")
+        return files
+
+    async def loadIfRequired(self):
+        deadline = asyncio.get_running_loop().time() + self.poll_deadline
+        try:
+            async with self._exclusive(Priority.POLL, deadline, key="poll"):
+                return await self.load()
+        except (Superseded, DeadlineExceeded) as e:
+            self.metrics.inc("polls_dropped")
+            _LOGGER.debug(f"Poll of {self.host} dropped: {e!r}")
+            return ()
+
+    def _publish(self, state, loadtime, restored=False, stale_files=frozenset()):
+        start = perf_counter()
+        previous = self.snapshot
+        version = previous.version + 1 if previous is not None else 1
+        self.snapshot = self.plan.decode(state, loadtime, previous, version, restored, stale_files)
+        self.state = state
+        self.loadtime = loadtime
+        self.metrics.observe("decode_time", perf_counter() - start)
+        # wake everyone waiting in waitForSnapshot, later waiters get a fresh event
+        self._published.set()
+        self._published = asyncio.Event()
+
+    def exportState(self):
+        """Return the registers the integration uses with their load time, small enough to persist."""
+        return {
+            "loadtime": self.loadtime,
+            "state": {key: self.state[key] for key in self.wanted if key in self.state},
+        }
+
+    def restore(self, data):
+        """Publish a state saved by exportState() as a restored snapshot, unless one was loaded already."""
+        if self.snapshot is not None:
+            return
+        self._restored = MappingProxyType(dict(data["state"]))
+        self._publish(self._restored, data["loadtime"], restored=True)
+
+    async def waitForSnapshot(self, version=0, timeout=None):
+        """Return the first snapshot newer than version, without queueing for the controller."""
+        async def wait():
+            while self.snapshot is None or self.snapshot.version <= version:
+                await self._published.wait()
+            return self.snapshot
+        return await asyncio.wait_for(wait(), timeout)
+
+    async def getSnapshot(self):
+        """Return the current snapshot without waiting for a poll in progress.
+
+        Only the very first read has to wait for a load, concurrent first
+        reads share it. When files are due, a refresh is started in the
+        background and the current snapshot is returned right away.
+        """
+        while self.snapshot is None:
+            # keyed None next to the file reads, a poll dropped for a newer one is tried again
+            await singleFlight(self._inflight, None, self.loadIfRequired)
+        if self._refreshTask is None and self.dueFiles():
+            self._refreshTask = self._spawn(self._refresh())
+        return self.snapshot
+
+    async def _refresh(self):
+        try:
+            await self.loadIfRequired()
+        except Exception as e:
+            _LOGGER.debug(f"Background refresh of {self.host} failed: {e}")
+        finally:
+            self._refreshTask = None
+
+
+    async def _login(self, level):
+        import aiohttp
+        self.requests += 1
+        try:
+            async with self.limiter.slot(), self._getSession().post(
+                f'{self.host}/login.html', 
+                data={"pass": self.password[level]},
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+            ) as response:
+                return response.status == 200
+        except Exception as e:
+            _LOGGER.error(f"Login failed: {e}")
+            return False
+
+    async def _button(self, button: int):
+        import aiohttp
+        self.requests += 1
+        try:
+            async with self.limiter.slot(), self._getSession().get(
+                f'{self.host}/t_but.cgi?but={button}',
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+            ) as response:
+                return response.status == 200
+        except Exception as e:
+            _LOGGER.error(f"Button press failed: {e}")
+            return False
 
     async def login(self, level=AccessLevel.LOGOUT):
-        async with self._sequential_lock:
-            try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(
-                        f'{self.host}/login.html', 
-                        data={"pass": self.password[level]},
-                        timeout=aiohttp.ClientTimeout(total=10)
-                    ) as response:
-                        return response.status == 200
-            except Exception as e:
-                _LOGGER.error(f"Login failed: {e}")
-                return False
+        async with self._exclusive(Priority.CONTROL):
+            return await self._login(level)
     
     async def logout(self, save=False):
         if save:
@@ -256,76 +1553,174 @@ class IQR23:
         await self.login(AccessLevel.LOGOUT)
 
     async def _pressBtn(self, button: int):
-        async with self._sequential_lock:
-            try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(
-                        f'{self.host}/t_but.cgi?but={button}',
-                        timeout=aiohttp.ClientTimeout(total=10)
-                    ) as response:
-                        return response.status == 200
-            except Exception as e:
-                _LOGGER.error(f"Button press failed: {e}")
-                return False
+        async with self._exclusive(Priority.CONTROL):
+            return await self._button(button)
 
     async def setDigitalOutputMode(self, output, value):
         try:
-            output = DIGITAL_OUTPUTS[output]
+            hw_output = DIGITAL_OUTPUTS[output]
         except KeyError: 
             raise KeyError("Output not found")
-        try:
-            btn = output.control_set[value]
-        except KeyError:
+        if value not in hw_output.control_set:
             raise KeyError("Value not found")
-        await self.login(AccessLevel.MASTER)
-        await self._pressBtn(btn)
-        await self.logout()
-        await self.load()
-    
-    async def getDigitalOutputMode(self, output):
-        await self.loadIfRequired()
+        if self._closed:
+            raise ClientClosed(f"{self.host} client is closed")
+
+        # requests arriving within command_window share one master session
+        future = asyncio.get_running_loop().create_future()
+        _, futures = self._pendingModes.get(output, (None, []))
+        self._pendingModes[output] = (value, futures + [future])
+        if self._commandTask is None:
+            self._commandTask = self._spawn(self._runCommands())
+        await future
+
+    async def _runCommands(self):
+        await asyncio.sleep(self.command_window)
+        pending, self._pendingModes = self._pendingModes, dict()
+        self._commandTask = None
+        futures = [future for _, waiting in pending.values() for future in waiting]
         try:
-            output = DIGITAL_OUTPUTS[output]
-        except KeyError: 
+            self.last_batch = await self._applyModes({output: value for output, (value, _) in pending.items()})
+        except asyncio.CancelledError:
+            # only close() cancels a batch
+            for future in futures:
+                if not future.done():
+                    future.set_exception(ClientClosed(f"{self.host} client closed while applying output modes"))
+            raise
+        except Exception as e:
+            self.metrics.inc("control_errors")
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future in futures:
+            if not future.done():
+                future.set_result(None)
+
+    async def _applyModes(self, modes):
+        import aiohttp
+        requests = self.requests
+        start = perf_counter()
+        async with self._exclusive(Priority.CONTROL):
+            # nothing to press for outputs already in the requested mode
+            buttons = [
+                DIGITAL_OUTPUTS[output].control_set[value]
+                for output, value in modes.items()
+                if self._outputMode(DIGITAL_OUTPUTS[output]) != value
+            ]
+            if buttons:
+                if not await self._login(AccessLevel.MASTER):
+                    raise aiohttp.ClientError("Master login failed")
+                try:
+                    for button in buttons:
+                        if not await self._button(button):
+                            raise aiohttp.ClientError(f"Button {button} press failed")
+                finally:
+                    await self._login(AccessLevel.LOGOUT)
+                # queued before the presses release the controller, so no waiting poll gets in between
+                verify = self.scheduler.request(Priority.VERIFY)
+        if buttons:
+            # verification read of just the file with the status and mode registers,
+            # the settings files follow on the next poll
+            outputs = [DIGITAL_OUTPUTS[output] for output in modes]
+            keys = [output.status for output in outputs] + [key for output in outputs for key in output.control_get]
+            async with self._exclusive(Priority.VERIFY, ticket=verify):
+                await self.load(self.filesFor(keys))
+            self.forceFiles(SETTINGS_FILES)
+            mismatched = {output: value for output, value in modes.items() if self._outputMode(DIGITAL_OUTPUTS[output]) != value}
+            if mismatched:
+                self.metrics.inc("control_mismatches", len(mismatched))
+                _LOGGER.warning(f"{self.host} did not apply output modes {mismatched}")
+        batch = {"requested": len(modes), "pressed": len(buttons), "round_trips": self.requests - requests}
+        self.metrics.inc("control_batches")
+        self.metrics.inc("control_presses", len(buttons))
+        self.metrics.observe("control_time", perf_counter() - start)
+        _LOGGER.debug(f"Applied output modes {modes} on {self.host}: {batch}")
+        return batch
+
+    async def getDigitalOutputMode(self, output):
+        if output not in DIGITAL_OUTPUTS:
             raise KeyError("Output not found")
-        setup = output.control_get
-        for k, v in setup.items():
-            if(self.state.get(k) == '1'):
-                return v
-        else:
+        _, mode = (await self.getSnapshot()).output(output)
+        if mode is None:
             raise KeyError("Value not found")
+        return mode
+
+    def _outputMode(self, output, state=None):
+        state = self.state if state is None else state
+        for k, v in output.control_get.items():
+            if state.get(k) == '1':
+                return v
         return None
 
     async def getDigitalOutputState(self, output):
-        await self.loadIfRequired()
-        try:
-            output = DIGITAL_OUTPUTS[output]
-        except KeyError: 
+        if output not in DIGITAL_OUTPUTS:
             raise KeyError("Output not found")
-
-        try:
-            value = self.state.get(output.status)
-        except:
-            raise KeyError("Value not found")
-        return value == '1'
+        value, _ = (await self.getSnapshot()).output(output)
+        return value
     
     async def getSensor(self, name):
-        await self.loadIfRequired()
-        try:
-            sensor = SENSORS[name]
-        except KeyError: 
+        if name not in self.sensors:
             raise KeyError("Sensor not found")
-
-        try:
-            value = self.state[sensor.name]
-        except KeyError:
+        snapshot = await self.getSnapshot()
+        if snapshot.raws[snapshot.plan.sensor_index[name]] is None:
             raise KeyError("Value not found")
-        return sensor.parse(value)
+        return snapshot.sensor(name)
 
     def __repr__(self):
         return f"<IQR23({self.host}, {self.loadtime})>"
 
 
+class StaggeredScheduler:
+    """Polls many controllers from one timer, spreading their phases evenly over the interval.
+
+    Every job is a coroutine function started interval / N seconds after the
+    previous one, so N controllers never poll at the same moment. A job still
+    running from the previous round is skipped instead of piling up.
+    create_task starts the timer and the jobs, so an owner can track them.
+    """
+
+    def __init__(self, interval, create_task=asyncio.ensure_future):
+        self.interval = interval
+        self._create_task = create_task
+        self._jobs = dict()
+        self._running = dict()
+        self._task = None
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def add(self, key, job):
+        self._jobs[key] = job
+        if self._task is None or self._task.done():
+            self._task = self._create_task(self._run())
+
+    def remove(self, key):
+        self._jobs.pop(key, None)
+        task = self._running.pop(key, None)
+        if task is not None:
+            task.cancel()
+        if not self._jobs and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _call(self, key, job):
+        try:
+            await job()
+        except Exception as e:
+            _LOGGER.error(f"Scheduled poll of {key} failed: {e}")
+        finally:
+            self._running.pop(key, None)
+
+    async def _run(self):
+        while self._jobs:
+            for key in list(self._jobs):
+                job = self._jobs.get(key)
+                if job is not None and key not in self._running:
+                    self._running[key] = self._create_task(self._call(key, job))
+                await asyncio.sleep(self.interval / max(1, len(self._jobs)))
+
+
 def run_async(coroutine):
     import asyncio
     loop = asyncio.new_event_loop()
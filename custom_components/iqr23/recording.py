@@ -0,0 +1,216 @@
+"""Recording of raw controller responses and their replay into an IQR23 client."""
+import asyncio
+import gzip
+import logging
+import os
+import struct
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+_LOGGER = logging.getLogger(__name__)
+
+# recorder segments, each a gzip file named by the time of its first response in ms
+RECORD_SUFFIX = ".xml.gz"
+RECORD_SEGMENT_SECONDS = 3600
+RECORD_SEGMENT_BYTES = 16 * 1024 * 1024
+RECORD_FLUSH_SECONDS = 60
+# time, flags, file name length, body length; the name and the body follow
+_RECORD = struct.Struct("<dBBI")
+# the body equals the previous one of the file in the segment and is not stored
+RECORD_UNCHANGED = 1
+
+
+class ResponseRecorder:
+    """Append raw controller responses to gzip compressed segment files.
+
+    A segment is closed after segment_seconds or segment_bytes of responses
+    and is named after the time of its first response, which is the index a
+    Recording seeks by. A response equal to the previous one of its file is
+    stored as a mark only, resolved within the same segment. With keep given
+    only that many segments are kept, the oldest are deleted.
+    """
+
+    def __init__(self, directory, segment_seconds=RECORD_SEGMENT_SECONDS, segment_bytes=RECORD_SEGMENT_BYTES, keep=None):
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.segment_bytes = segment_bytes
+        self.keep = keep
+        self._file = None
+        self._start = None
+        self._flushed = None
+        self._size = 0
+        # last body of every file, and the files stored in full in the open segment
+        self._last = dict()
+        self._written = set()
+        # one thread writes, in the order responses came in, and never on the event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="iqr23_recorder")
+
+    def append(self, file, body, timestamp=None):
+        """Queue a response for writing, None for a 304 repeating the previous body of the file."""
+        timestamp = time() if timestamp is None else timestamp
+        self._executor.submit(self._write, file, body, timestamp)
+
+    async def close(self):
+        """Write the queued responses and close the open segment."""
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._close)
+        self._executor.shutdown(wait=False)
+
+    def _write(self, file, body, timestamp):
+        try:
+            self._append(file, body, timestamp)
+        except OSError as e:
+            _LOGGER.warning(f"Recording {file} to {self.directory} failed: {e}")
+
+    def _append(self, file, body, timestamp):
+        if body is None:
+            body = self._last.get(file)
+            if body is None:
+                return
+        if self._file is None or timestamp - self._start >= self.segment_seconds or self._size >= self.segment_bytes:
+            self._rotate(timestamp)
+        flags = 0
+        if file in self._written and body == self._last[file]:
+            flags, stored = RECORD_UNCHANGED, b""
+        else:
+            stored = body
+            self._last[file] = body
+            self._written.add(file)
+        name = file.encode()
+        self._file.write(_RECORD.pack(timestamp, flags, len(name), len(stored)) + name + stored)
+        self._size += len(stored)
+        if timestamp - self._flushed >= RECORD_FLUSH_SECONDS:
+            self._file.flush()
+            self._flushed = timestamp
+
+    def _rotate(self, timestamp):
+        self._close()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{int(timestamp * 1000):013d}{RECORD_SUFFIX}")
+        self._file = gzip.open(path, "ab")
+        self._start = self._flushed = timestamp
+        self._size = 0
+        self._written = set()
+        if self.keep:
+            for _, old in Recording(self.directory).segments[:-self.keep]:
+                os.remove(old)
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class Recording:
+    """The segments a ResponseRecorder wrote to a directory, in time order.
+
+    Reading is blocking, recordings are replayed offline.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.segments = sorted(
+            (int(name[:-len(RECORD_SUFFIX)]) / 1000, os.path.join(directory, name))
+            for name in os.listdir(directory)
+            if name.endswith(RECORD_SUFFIX)
+        )
+
+    @property
+    def start(self):
+        return self.segments[0][0] if self.segments else None
+
+    def records(self, since=None, until=None):
+        """Yield the (time, file, body) of every response from since to until."""
+        first = 0
+        if since is not None:
+            first = max(0, bisect_right([start for start, _ in self.segments], since) - 1)
+        for _, path in self.segments[first:]:
+            last = dict()
+            with gzip.open(path, "rb") as f:
+                while True:
+                    try:
+                        header = f.read(_RECORD.size)
+                        if len(header) < _RECORD.size:
+                            break
+                        timestamp, flags, name_length, body_length = _RECORD.unpack(header)
+                        file = f.read(name_length).decode()
+                        body = f.read(body_length)
+                    except (EOFError, OSError):
+                        # still being written, or cut short by a crash
+                        break
+                    if len(body) < body_length:
+                        break
+                    if flags & RECORD_UNCHANGED:
+                        body = last[file]
+                    else:
+                        last[file] = body
+                    if until is not None and timestamp > until:
+                        return
+                    if since is None or timestamp >= since:
+                        yield timestamp, file, body
+
+
+class ReplayTransport:
+    """Answer the file reads of an IQR23 from a Recording instead of the controller.
+
+    Given as IQR23(..., transport=...), every read returns the latest
+    response recorded for the file at the replay clock, which starts at
+    since and runs speed times faster than real time. play() drives the
+    client itself and loads every recorded poll cycle in order.
+    """
+
+    def __init__(self, recording, speed=1.0, since=None):
+        self._records = recording.records(since)
+        self._next = next(self._records, None)
+        self.origin = since if since is not None or self._next is None else self._next[0]
+        self.speed = speed
+        self.current = dict()
+        self._started = None
+        self._playing = False
+
+    def clock(self):
+        now = asyncio.get_running_loop().time()
+        if self._started is None:
+            self._started = now
+        return self.origin + (now - self._started) * self.speed
+
+    def _advance(self, until):
+        files = dict()
+        while self._next is not None and self._next[0] <= until:
+            _, file, body = self._next
+            self.current[file] = files[file] = body
+            self._next = next(self._records, None)
+        return files
+
+    async def fetch(self, file):
+        if not self._playing:
+            self._advance(self.clock())
+        body = self.current.get(file)
+        if body is None:
+            import aiohttp
+            raise aiohttp.ClientError(f"{file} not recorded yet")
+        return body
+
+    async def play(self, api):
+        """Load the recorded cycles into api at the recorded pace, as fast as possible with speed None.
+
+        Returns the number of cycles loaded.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        cycles = 0
+        self._playing = True
+        try:
+            while self._next is not None:
+                # the responses of one load share its start time
+                cycle = self._next[0]
+                files = tuple(file for file in self._advance(cycle) if file in api.polls)
+                if self.speed:
+                    delay = started + (cycle - self.origin) / self.speed - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                await api.load(files)
+                cycles += 1
+        finally:
+            self._playing = False
+        return cycles
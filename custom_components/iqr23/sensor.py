@@ -1,64 +1,78 @@
-import asyncio
 import logging
-from datetime import timedelta
 
-import aiohttp
-from homeassistant.components.sensor import SensorEntity
+from homeassistant.components.sensor import SensorEntity, SensorStateClass
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import EntityCategory
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+from homeassistant.util import dt as dt_util
 from .const import DOMAIN
-from .iqr23 import IQR23, SENSORS, Sensor
+from .coordinator import IQR23Coordinator
+from .entity import IQR23Entity
+from .iqr23 import Sensor
 
 _LOGGER = logging.getLogger(__name__)
 
+def _last_ms(name):
+    def value(metrics):
+        last = metrics.histograms[name].last if name in metrics.histograms else None
+        return None if last is None else round(last * 1000, 1)
+    return value
+
+# uid: (name, unit, state class, getter on IQR23.metrics)
+METRIC_SENSORS = {
+    "cycleTime": ("Poll cycle time", "ms", SensorStateClass.MEASUREMENT, _last_ms("cycle_time")),
+    "lockWait": ("Lock wait time", "ms", SensorStateClass.MEASUREMENT, _last_ms("lock_wait")),
+    "setupTime": ("Setup time", "ms", SensorStateClass.MEASUREMENT, _last_ms("setup_time")),
+    "entityUpdateTime": ("Entity update time", "ms", SensorStateClass.MEASUREMENT, _last_ms("entity_update_time")),
+    "errors": ("Communication errors", None, SensorStateClass.TOTAL_INCREASING, lambda metrics: metrics.total("errors.")),
+    "parseSkipRatio": ("Unchanged responses", "%", SensorStateClass.MEASUREMENT, lambda metrics: metrics.ratio("parses_skipped", "responses")),
+    "bytesReceived": ("Bytes received", "B", SensorStateClass.TOTAL_INCREASING, lambda metrics: metrics.total("bytes.")),
+}
+
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback) -> None:
-    api = hass.data[DOMAIN]["api"]
-    device_info = hass.data[DOMAIN]["device_info"]
+    coordinator = hass.data[DOMAIN][entry.entry_id]["coordinator"]
+    device_info = hass.data[DOMAIN][entry.entry_id]["device_info"]
 
     new_entities = []
-    for uid, sensor_info in SENSORS.items():
+    # SENSORS plus the extra registers enabled in the options
+    for uid, sensor_info in coordinator.api.sensors.items():
         if sensor_info.type == bool:
             continue
-        new_entities.append(IQR23Sensor(api, uid, sensor_info, device_info))
+        new_entities.append(IQR23Sensor(coordinator, uid, sensor_info, device_info))
+
+    for uid in METRIC_SENSORS:
+        new_entities.append(IQR23MetricSensor(coordinator, uid, device_info))
 
     if new_entities:
-        async_add_entities(new_entities, update_before_add=True)
+        async_add_entities(new_entities)
 
-class IQR23Sensor(SensorEntity):
+class IQR23Sensor(IQR23Entity, SensorEntity):
 
-    def __init__(self, api: IQR23, uid: str, sensor_info: Sensor, device_info: dict):
-        super().__init__()
-        self._api = api
-        self._uid = uid
+    def __init__(self, coordinator: IQR23Coordinator, uid: str, sensor_info: Sensor, device_info: dict):
+        self._index = coordinator.api.plan.sensor_index[uid]
         self._sensor_info = sensor_info
-        self._device_info = device_info
-        self._attr_available = False
-        self._attr_has_entity_name = True
-
-    async def async_update(self) -> None:
-        try:
-            self._attr_native_value = await self._api.getSensor(self._uid)
-            #self._attr_extra_state_attributes = res["info"]
-            self._attr_available = True
-        except (asyncio.TimeoutError, aiohttp.ClientError, KeyError) as e:
-            _LOGGER.debug(f"Error updating sensor {self._uid}: {e}")
-            self._attr_available = False
+        super().__init__(coordinator, uid, (sensor_info.name,), device_info)
+        # the first update is published whatever the publish interval
+        self._last_published = None
 
-    @property
-    def device_info(self):
-        # https://developers.home-assistant.io/docs/device_registry_index/#device-properties
-        return self._device_info
+    def _read(self):
+        return self.coordinator.data.values[self._index]
+
+    def _apply(self, value) -> None:
+        super()._apply(value)
+        self._attr_native_value = value
+        self._last_published = dt_util.utcnow()
+
+    def _changed(self, value) -> bool:
+        return self._sensor_info.should_publish(self._value, value, self._last_published, dt_util.utcnow())
 
     @property
     def name(self):
         return self._sensor_info.friendly_name or f"iqr23_{self._uid}"
 
-    @property
-    def unique_id(self):
-        return f"iqr23_{self._uid}"
-
     @property
     def friendly_name(self):
         return self._sensor_info.friendly_name
@@ -77,4 +91,28 @@ class IQR23Sensor(SensorEntity):
 
     @property
     def native_unit_of_measurement(self):
-        return self._sensor_info.unit
\ No newline at end of file
+        return self._sensor_info.unit
+
+
+class IQR23MetricSensor(CoordinatorEntity[IQR23Coordinator], SensorEntity):
+    """Runtime performance metric of the controller client, disabled by default."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+    _attr_has_entity_name = True
+
+    def __init__(self, coordinator: IQR23Coordinator, uid: str, device_info: dict):
+        super().__init__(coordinator)
+        self._uid = uid
+        self._attr_name, self._attr_native_unit_of_measurement, self._attr_state_class, self._getter = METRIC_SENSORS[uid]
+        self._attr_unique_id = f"iqr23_{coordinator.controller_id}_metric_{uid}"
+        self._attr_device_info = device_info
+
+    @property
+    def available(self) -> bool:
+        # metrics describe failed polls too
+        return True
+
+    @property
+    def native_value(self):
+        return self._getter(self.coordinator.api.metrics)
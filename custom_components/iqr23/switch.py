@@ -1,74 +1,88 @@
-import asyncio
 import logging
-from datetime import timedelta
 
-import aiohttp
 from homeassistant.components.switch import SwitchEntity
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from .const import DOMAIN
-from .iqr23 import IQR23, DIGITAL_OUTPUTS, HardwareDigitalOutput
+from .coordinator import IQR23Coordinator
+from .entity import IQR23Entity
+from .iqr23 import DIGITAL_OUTPUTS, HardwareDigitalOutput
 
 _LOGGER = logging.getLogger(__name__)
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback) -> None:
-    api = hass.data[DOMAIN]["api"]
-    device_info = hass.data[DOMAIN]["device_info"]
+    coordinator = hass.data[DOMAIN][entry.entry_id]["coordinator"]
+    device_info = hass.data[DOMAIN][entry.entry_id]["device_info"]
 
     new_entities = []
 
     for uid, output_info in DIGITAL_OUTPUTS.items():
-        new_entities.append(IQR23Switch(api, uid, output_info, device_info))
+        new_entities.append(IQR23Switch(coordinator, uid, output_info, device_info))
 
     if new_entities:
-        async_add_entities(new_entities, update_before_add=True)
+        async_add_entities(new_entities)
 
-class IQR23Switch(SwitchEntity):
+class IQR23Switch(IQR23Entity, SwitchEntity):
 
-    def __init__(self, api: IQR23, uid: str, info: HardwareDigitalOutput, device_info: dict):
-        super().__init__()
-        self._api = api
-        self._uid = uid
+    def __init__(self, coordinator: IQR23Coordinator, uid: str, info: HardwareDigitalOutput, device_info: dict):
+        self._index = coordinator.api.plan.output_index[uid]
         self._info = info
-        self._device_info = device_info
-        self._attr_available = False
-        self._attr_has_entity_name = True
+        # mode requested but not yet confirmed by the controller
+        self._pending_mode = None
+        super().__init__(coordinator, uid, (info.status, *info.control_get), device_info)
 
-    async def async_update(self) -> None:
-        try:
-            self._attr_is_on = await self._api.getDigitalOutputState(self._uid)
-            #self._attr_extra_state_attributes = res["info"]
-            self._attr_available = (await self._api.getDigitalOutputMode(self._uid)) in ["on", "off"]
-        except (asyncio.TimeoutError, aiohttp.ClientError, KeyError) as e:
-            _LOGGER.debug(f"Error updating switch {self._uid}: {e}")
-            self._attr_available = False
+    def _read(self):
+        return self.coordinator.data.states[self._index], self.coordinator.data.modes[self._index]
 
-    @property
-    def name(self):
-        return self._info.name
+    def _apply(self, value) -> None:
+        super()._apply(value)
+        self._attr_is_on, self._mode = value
 
-    @property
-    def unique_id(self):
-        return f"iqr23_{self._uid}"
+    def _usable(self, value) -> bool:
+        return value[1] in ["on", "off"]
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        if self._pending_mode is not None:
+            # keep the optimistic state until the verification read is in
+            return
+        super()._handle_coordinator_update()
 
     @property
-    def device_info(self):
-        # https://developers.home-assistant.io/docs/device_registry_index/#device-properties
-        return self._device_info
+    def name(self):
+        return self._info.name
 
     async def async_turn_on(self, **kwargs):
         """Instruct the light to turn on."""
         #_LOGGER.warning(f"Tunrning on {self._uid}, {kwargs}")
-        await self._api.setDigitalOutputMode(self._uid, "on")
-        self._attr_is_on = True
+        self._set_mode_optimistic("on")
 
 
     async def async_turn_off(self, **kwargs):
         """Instruct the light to turn off."""
         #_LOGGER.warning(f"Tunrning off {self._uid}, {kwargs}")
-        await self._api.setDigitalOutputMode(self._uid, "off")
-        self._attr_is_on = False
+        self._set_mode_optimistic("off")
+
+    @callback
+    def _set_mode_optimistic(self, mode):
+        """Show the requested mode right away and apply it on the controller in the background."""
+        self._pending_mode = mode
+        self._apply((mode == "on", mode))
+        self.async_write_ha_state()
+        self.hass.async_create_task(self._async_apply_mode(mode))
+
+    async def _async_apply_mode(self, mode):
+        try:
+            await self.coordinator.async_set_output_mode(self._uid, mode)
+        except Exception as e:
+            _LOGGER.error(f"Setting {self._uid} to {mode} failed: {e}")
+        finally:
+            if self._pending_mode == mode:
+                self._pending_mode = None
+                # publish what the controller reported, rolling back a mode it did not take
+                self._published_available = None
+                self._handle_coordinator_update()
 
     # @property
     # def device_class(self):
@@ -0,0 +1 @@
+"""Benchmarks for the iQ R23 client."""
@@ -0,0 +1,225 @@
+"""Benchmark suite for the IQR23 client against a local fake controller.
+
+Run with ``python -m tests.benchmarks.bench_client``. Measures IQR23.load
+latency, parse CPU time, per-entity update throughput, lock contention of
+readers behind a control sequence and setDigitalOutputMode round trips.
+The result is one JSON document, ``--output`` appends it as a line to a
+JSON Lines file so runs can be compared over time.
+"""
+import argparse
+import asyncio
+from datetime import datetime, timezone
+import json
+import platform
+import statistics
+import time
+
+from custom_components.iqr23.iqr23 import (
+    DIGITAL_OUTPUTS,
+    FILES,
+    IQR23,
+    PARSER_STREAM,
+    PARSER_XMLTODICT,
+    SENSORS,
+    WANTED_KEYS,
+)
+
+from ..fake_controller import FIXTURES, FakeController
+from .bench_parse import load_captures, measure
+
+SCHEMA_VERSION = 1
+
+
+def summary(samples):
+    """Return latency percentiles in milliseconds."""
+    samples = sorted(samples)
+    if not samples:
+        return {"count": 0}
+    quantiles = (
+        statistics.quantiles(samples, n=20) if len(samples) > 1 else samples * 19
+    )
+    return {
+        "count": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1e3,
+        "p50_ms": quantiles[9] * 1e3,
+        "p95_ms": quantiles[18] * 1e3,
+        "max_ms": samples[-1] * 1e3,
+    }
+
+
+def client(controller, args):
+    return IQR23(
+        controller.host, max_concurrency=args.max_concurrency, parser=args.parser
+    )
+
+
+async def bench_load(controller, args):
+    api = client(controller, args)
+    samples = []
+    errors = 0
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        try:
+            await api.load(FILES)
+        except Exception:
+            errors += 1
+            continue
+        samples.append(time.perf_counter() - start)
+    await api.close()
+    return dict(summary(samples), errors=errors)
+
+
+async def bench_entity_updates(controller, args):
+    api = client(controller, args)
+    await api.load(FILES)
+    published = dict()
+    last_published = dict()
+    updates = 0
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        snapshot = api.snapshot
+        now = datetime.now()
+        for index, sensor in enumerate(SENSORS.values()):
+            value = snapshot.values[index]
+            if sensor.should_publish(
+                published.get(index), value, last_published.get(index), now
+            ):
+                published[index] = value
+                last_published[index] = now
+            updates += 1
+        for index in range(len(DIGITAL_OUTPUTS)):
+            snapshot.states[index], snapshot.modes[index]
+            updates += 1
+    elapsed = time.perf_counter() - start
+    await api.close()
+    return {
+        "entities": len(SENSORS) + len(DIGITAL_OUTPUTS),
+        "cycles": args.rounds,
+        "updates_per_s": updates / elapsed,
+        "cycle_us": elapsed / args.rounds * 1e6,
+    }
+
+
+async def bench_lock_contention(controller, args):
+    """Time entity reads issued while a control sequence holds the controller."""
+    api = client(controller, args)
+    await api.load(FILES)
+    samples = []
+
+    async def read(uid):
+        start = time.perf_counter()
+        try:
+            await api.getSensor(uid)
+        except KeyError:
+            pass
+        samples.append(time.perf_counter() - start)
+
+    for _ in range(max(1, args.rounds // 10)):
+        mode = "on" if api.snapshot.outputs["SP2"][1] != "on" else "off"
+        control = asyncio.ensure_future(api.setDigitalOutputMode("SP2", mode))
+        await asyncio.sleep(api.command_window + controller.latency / 2)
+        api.forceFiles(FILES)
+        await asyncio.gather(*(read(uid) for uid in SENSORS))
+        await control
+    await api.close()
+    return dict(summary(samples), readers=len(SENSORS))
+
+
+async def bench_control(controller, args):
+    api = client(controller, args)
+    await api.load(FILES)
+    result = {}
+    for name, outputs in (("single", ("SP1",)), ("batch", ("SP1", "SP2", "TVC"))):
+        modes = {
+            uid: "on" if api.snapshot.output(uid)[1] != "on" else "off"
+            for uid in outputs
+        }
+        controller.requests.clear()
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(api.setDigitalOutputMode(uid, mode) for uid, mode in modes.items())
+        )
+        result[name] = {
+            "outputs": len(outputs),
+            "round_trips": len(controller.requests),
+            "latency_ms": (time.perf_counter() - start) * 1e3,
+        }
+    await api.close()
+    return result
+
+
+async def run_suite(args):
+    controller = await FakeController(
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        seed=args.seed,
+    ).start()
+    try:
+        results = {
+            "schema": SCHEMA_VERSION,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "config": {
+                "rounds": args.rounds,
+                "latency_s": args.latency,
+                "jitter_s": args.jitter,
+                "failure_rate": args.failure_rate,
+                "parser": args.parser,
+                "max_concurrency": args.max_concurrency,
+            },
+            "load": await bench_load(controller, args),
+        }
+        wanted = WANTED_KEYS if args.parser == PARSER_STREAM else None
+        results["parse"] = measure(load_captures(FIXTURES), wanted, args.rounds)
+        # the remaining benchmarks measure the client, not the injected failures
+        controller.failure_rate = 0
+        results["entity_updates"] = await bench_entity_updates(controller, args)
+        results["lock_contention"] = await bench_lock_contention(controller, args)
+        results["control"] = await bench_control(controller, args)
+    finally:
+        await controller.close()
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.02,
+        help="controller response delay in seconds",
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.01, help="uniform extra delay in seconds"
+    )
+    parser.add_argument(
+        "--failure-rate",
+        type=float,
+        default=0.0,
+        help="probability of an HTTP 500 response",
+    )
+    parser.add_argument("--seed", type=int, default=23)
+    parser.add_argument(
+        "--parser", choices=(PARSER_XMLTODICT, PARSER_STREAM), default=PARSER_XMLTODICT
+    )
+    parser.add_argument("--max-concurrency", type=int, default=1)
+    parser.add_argument(
+        "--output", help="append the result as one line to this JSON Lines file"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = asyncio.run(run_suite(args))
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(results) + "\n")
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == "__main__":
+    main()
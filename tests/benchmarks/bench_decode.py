@@ -0,0 +1,74 @@
+"""Compare per-entity register decoding with the compiled DecodePlan.
+
+Run with ``python -m tests.benchmarks.bench_decode``. Prints the decode cost
+of one poll cycle in microseconds as JSON: the per-entity lookup path the
+entities used before (a SENSORS lookup, a state lookup and a conversion per
+sensor, two control_get scans per switch) against PLAN.decode from scratch,
+with every register unchanged and with one register changed.
+"""
+import argparse
+import json
+import time
+
+from custom_components.iqr23.iqr23 import DIGITAL_OUTPUTS, PLAN, SENSORS
+
+from .bench_parse import FIXTURES, load_captures, parse_cycle
+
+
+def per_entity_cycle(state):
+    for uid in SENSORS:
+        sensor = SENSORS[uid]
+        try:
+            sensor.parse(state[sensor.name])
+        except (KeyError, ValueError, IndexError):
+            pass
+    for uid in DIGITAL_OUTPUTS:
+        output = DIGITAL_OUTPUTS[uid]
+        state.get(output.status) == "1"
+        # the switch read its state and its mode, each scanning the registers
+        for _ in range(2):
+            for key, mode in output.control_get.items():
+                if state.get(key) == "1":
+                    break
+
+
+def timed(cycle, rounds):
+    cycle()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        cycle()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--captures",
+        default=FIXTURES,
+        help="directory with <file>.xml controller responses",
+    )
+    parser.add_argument("--rounds", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    state = parse_cycle(load_captures(args.captures), None)
+    previous = PLAN.decode(state, 0)
+    changed = dict(state, **{PLAN.keys[0]: "-99.9"})
+
+    results = {
+        "sensors": len(SENSORS),
+        "outputs": len(DIGITAL_OUTPUTS),
+        "per_entity_us": timed(lambda: per_entity_cycle(state), args.rounds),
+        "plan_cold_us": timed(lambda: PLAN.decode(state, 0), args.rounds),
+        "plan_unchanged_us": timed(
+            lambda: PLAN.decode(state, 0, previous), args.rounds
+        ),
+        "plan_one_changed_us": timed(
+            lambda: PLAN.decode(changed, 0, previous), args.rounds
+        ),
+    }
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == "__main__":
+    main()
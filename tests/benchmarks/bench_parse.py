@@ -0,0 +1,97 @@
+"""Compare the xmltodict and the selective stream parser on controller responses.
+
+Run with ``python -m tests.benchmarks.bench_parse``. The default responses in
+tests/fixtures are synthesized in the controller's format, point ``--captures``
+at a directory of real ``<file>.xml`` captures to measure a specific device.
+Prints one JSON document with per-cycle CPU time and allocation figures.
+"""
+import argparse
+import json
+import os
+import time
+import tracemalloc
+
+from custom_components.iqr23.iqr23 import (
+    FILES,
+    PARSER_STREAM,
+    PARSER_XMLTODICT,
+    WANTED_KEYS,
+    parseXml,
+)
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(__file__)), "fixtures")
+
+
+def load_captures(directory):
+    captures = {}
+    for file in FILES:
+        with open(os.path.join(directory, f"{file}.xml"), "rb") as f:
+            captures[file] = f.read()
+    return captures
+
+
+def parse_cycle(captures, wanted):
+    state = dict()
+    for body in captures.values():
+        state.update(parseXml(body, wanted))
+    return state
+
+
+def measure(captures, wanted, rounds):
+    parse_cycle(captures, wanted)
+
+    start_cpu = time.process_time()
+    start_wall = time.perf_counter()
+    for _ in range(rounds):
+        parse_cycle(captures, wanted)
+    cpu = time.process_time() - start_cpu
+    wall = time.perf_counter() - start_wall
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    state = parse_cycle(captures, wanted)
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(
+        stat.size_diff
+        for stat in after.compare_to(before, "filename")
+        if stat.size_diff > 0
+    )
+
+    return {
+        "cpu_per_cycle_us": cpu / rounds * 1e6,
+        "wall_per_cycle_us": wall / rounds * 1e6,
+        "peak_bytes_per_cycle": peak,
+        "retained_bytes_per_cycle": allocated,
+        "keys": len(state),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--captures",
+        default=FIXTURES,
+        help="directory with <file>.xml controller responses",
+    )
+    parser.add_argument("--rounds", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    captures = load_captures(args.captures)
+    results = {
+        "bytes_per_cycle": sum(len(body) for body in captures.values()),
+        PARSER_XMLTODICT: measure(captures, None, args.rounds),
+        PARSER_STREAM: measure(captures, WANTED_KEYS, args.rounds),
+    }
+    results["cpu_speedup"] = (
+        results[PARSER_XMLTODICT]["cpu_per_cycle_us"]
+        / results[PARSER_STREAM]["cpu_per_cycle_us"]
+    )
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+"""Global fixtures for the iQ R23 integration tests."""
+from unittest.mock import patch
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations(enable_custom_integrations):
+    """Enable loading of the custom integration in every test."""
+    yield
+
+
+@pytest.fixture(autouse=True)
+def no_network_scan():
+    """Keep the discovery scan of the integration off the host's real networks."""
+    with patch("custom_components.iqr23.discovery._async_networks", return_value=[]):
+        yield
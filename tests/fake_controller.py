@@ -0,0 +1,165 @@
+"""A local fake iQ R23 controller serving captured responses over HTTP."""
+import asyncio
+import hashlib
+import os
+import random
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+import xmltodict
+
+from custom_components.iqr23.iqr23 import (
+    CATALOG_FILES,
+    DEFAULT_PASSWORD,
+    DIGITAL_OUTPUTS,
+    AccessLevel,
+)
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+class FakeController:
+    """Serve <file>.xml, login.html and t_but.cgi like the controller does.
+
+    Registers are kept per file and button presses change the output mode
+    registers, so reads after a press see the new state. Every request is
+    appended to ``requests`` as ``(method, path)``.
+
+    Each response is delayed by ``latency`` plus a uniform ``jitter`` and
+    fails with HTTP 500 with probability ``failure_rate``, files listed in
+    ``failing_files`` always fail. ``seed`` makes the injection repeatable.
+    With ``etag`` set, files carry an ETag and conditional requests for an
+    unchanged file get 304 Not Modified. ``peak`` is the largest number of
+    requests handled at the same time.
+    """
+
+    def __init__(
+        self,
+        fixtures=FIXTURES,
+        latency=0.0,
+        jitter=0.0,
+        failure_rate=0.0,
+        failing_files=(),
+        seed=None,
+        etag=False,
+    ):
+        self.files = {}
+        for file in CATALOG_FILES:
+            with open(os.path.join(fixtures, f"{file}.xml"), "rb") as f:
+                self.files[file] = dict(xmltodict.parse(f.read())["response"])
+        self.buttons = {}
+        for output in DIGITAL_OUTPUTS.values():
+            for mode, button in output.control_set.items():
+                self.buttons[button] = (output, mode)
+        self.level = AccessLevel.LOGOUT
+        self.requests = []
+        self.server = None
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failing_files = set(failing_files)
+        self.random = random.Random(seed)
+        self.etag = etag
+        self.active = 0
+        self.peak = 0
+
+    @property
+    def host(self):
+        return f"http://{self.server.host}:{self.server.port}"
+
+    def register(self, key):
+        for registers in self.files.values():
+            if key in registers:
+                return registers[key]
+        raise KeyError(key)
+
+    def set_register(self, key, value):
+        for registers in self.files.values():
+            if key in registers:
+                registers[key] = value
+                return
+        raise KeyError(key)
+
+    def mode(self, output):
+        output = DIGITAL_OUTPUTS[output]
+        for key, mode in output.control_get.items():
+            if self.register(key) == "1":
+                return mode
+        return None
+
+    def press(self, button):
+        output, mode = self.buttons[button]
+        for key, key_mode in output.control_get.items():
+            self.set_register(key, "1" if key_mode == mode else "0")
+        if mode in ("on", "off"):
+            self.set_register(output.status, "1" if mode == "on" else "0")
+
+    async def _respond(self):
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            raise web.HTTPInternalServerError()
+
+    async def _file(self, request):
+        file = request.match_info["file"]
+        self.requests.append(("GET", f"/{file}.xml"))
+        await self._respond()
+        if file in self.failing_files:
+            raise web.HTTPInternalServerError()
+        if file not in self.files:
+            raise web.HTTPNotFound()
+        body = xmltodict.unparse(
+            {"response": self.files[file]}, encoding="windows-1250"
+        ).encode("cp1250")
+        headers = {}
+        if self.etag:
+            headers["ETag"] = f'"{hashlib.md5(body).hexdigest()}"'
+            if request.headers.get("If-None-Match") == headers["ETag"]:
+                return web.Response(status=304, headers=headers)
+        return web.Response(
+            body=body, headers=headers, content_type="text/xml", charset="windows-1250"
+        )
+
+    async def _login(self, request):
+        self.requests.append(("POST", "/login.html"))
+        await self._respond()
+        password = (await request.post()).get("pass", "")
+        for level, level_password in DEFAULT_PASSWORD.items():
+            if password == level_password:
+                self.level = level
+                break
+        return web.Response(text="<html></html>", content_type="text/html")
+
+    async def _button(self, request):
+        self.requests.append(("GET", "/t_but.cgi"))
+        await self._respond()
+        if self.level == AccessLevel.MASTER:
+            button = int(request.query["but"])
+            if button in self.buttons:
+                self.press(button)
+        return web.Response(text="OK")
+
+    @web.middleware
+    async def _count(self, request, handler):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            return await handler(request)
+        finally:
+            self.active -= 1
+
+    def app(self):
+        app = web.Application(middlewares=[self._count])
+        app.router.add_get("/{file}.xml", self._file)
+        app.router.add_post("/login.html", self._login)
+        app.router.add_get("/t_but.cgi", self._button)
+        return app
+
+    async def start(self):
+        self.server = TestServer(self.app(), host="127.0.0.1")
+        await self.server.start_server()
+        return self
+
+    async def close(self):
+        await self.server.close()
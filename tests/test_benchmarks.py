@@ -0,0 +1,18 @@
+"""Smoke test the benchmark suite."""
+import json
+
+from .benchmarks.bench_client import parse_args, run_suite
+
+
+async def test_benchmark_suite_runs(socket_enabled):
+    """Test a short benchmark run produces a complete machine-readable result."""
+    results = await run_suite(
+        parse_args(["--rounds", "10", "--latency", "0", "--jitter", "0"])
+    )
+
+    assert json.loads(json.dumps(results)) == results
+    assert results["load"]["count"] == 10
+    assert results["load"]["errors"] == 0
+    assert results["lock_contention"]["readers"] > 0
+    assert results["control"]["single"]["round_trips"] == 3 + 1
+    assert results["control"]["batch"]["round_trips"] == 2 + 3 + 1
@@ -1,9 +1,326 @@
 """Test component setup."""
+import asyncio
+import json
+from datetime import timedelta
+from time import time
+from unittest.mock import patch
+
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.helpers import entity_registry as er
 from homeassistant.setup import async_setup_component
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.common import (
+    MockConfigEntry,
+    async_fire_time_changed,
+)
+
+from custom_components.iqr23.const import (
+    CATALOG_STORAGE_KEY,
+    CONF_EXTRA_REGISTERS,
+    DATA_SCHEDULERS,
+    DOMAIN,
+    STORAGE_SAVE_DELAY,
+)
+from custom_components.iqr23.diagnostics import async_get_config_entry_diagnostics
+from custom_components.iqr23.discovery import async_discover
+from custom_components.iqr23.iqr23 import FILES, IQR23
+
+STATE = {"txt113": "-3.5", "col202": "1", "col400": "1", "col403": "1"}
+
 
-from custom_components.iqr23.const import DOMAIN
+async def _fake_load(self, files=None, state=STATE):
+    # publishes like IQR23.load after a successful cycle
+    self._publish(dict(state), 100)
+    return FILES
 
 
 async def test_async_setup(hass):
     """Test the component gets setup."""
     assert await async_setup_component(hass, DOMAIN, {}) is True
+
+
+async def test_discovered_controllers(hass):
+    """Test scanned controllers show up as discovered flows and an empty host picks the only new one."""
+    # configured by name, scanned by address
+    configured = MockConfigEntry(
+        domain=DOMAIN, unique_id="http://localhost", data={"host": "http://localhost"}
+    )
+    configured.add_to_hass(hass)
+    found = {"http://127.0.0.1": "R23 v2.41", "http://10.0.0.9": "R23 v2.41"}
+
+    with patch.object(IQR23, "scan", return_value=found), patch.object(
+        IQR23, "load", _fake_load
+    ):
+        assert await async_discover(hass) == found
+        await hass.async_block_till_done()
+        flows = hass.config_entries.flow.async_progress_by_handler(DOMAIN)
+        assert [flow["context"]["unique_id"] for flow in flows] == ["http://10.0.0.9"]
+        assert flows[0]["step_id"] == "confirm"
+        result = await hass.config_entries.flow.async_init(
+            DOMAIN,
+            context={"source": "integration_discovery"},
+            data={"host": "http://127.0.0.1", "version": "R23 v2.41"},
+        )
+        assert result["type"] == "abort"
+
+        result = await hass.config_entries.flow.async_init(
+            DOMAIN, context={"source": "user"}
+        )
+        result = await hass.config_entries.flow.async_configure(
+            result["flow_id"], {"host": ""}
+        )
+        assert result["type"] == "create_entry"
+        assert result["data"] == {"host": "http://10.0.0.9", "version": "R23 v2.41"}
+        await hass.async_block_till_done()
+
+    # the discovered flow of the same controller went away with it
+    assert not hass.config_entries.flow.async_progress_by_handler(DOMAIN)
+    for entry in hass.config_entries.async_entries(DOMAIN):
+        assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_network_scan_can_be_turned_off(hass):
+    """Test no controller is searched for at startup when an entry turned the scan off."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={"host": "http://127.0.0.1"},
+        options={"scan_network": False},
+    )
+    entry.add_to_hass(hass)
+
+    with patch.object(IQR23, "load", _fake_load), patch.object(
+        IQR23, "scan", return_value={}
+    ) as scan:
+        assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+    assert not scan.called
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_setup_entry(hass):
+    """Test a config entry creates entities from one shared load."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        title="http://127.0.0.1",
+        unique_id="http://127.0.0.1",
+        data={"host": "http://127.0.0.1", "version": "1.0"},
+    )
+    entry.add_to_hass(hass)
+
+    with patch.object(IQR23, "load", _fake_load):
+        assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+    assert hass.states.get("sensor.iq_r23_outdoor_teperature").state == "-3.5"
+    assert hass.states.get("binary_sensor.iq_r23_tlak_v_systemu").state == "off"
+    assert hass.states.get("switch.iq_r23_sp1").state == "on"
+    assert hass.states.get("switch.iq_r23_sp2").state == "unavailable"
+    # every enabled entity subscribed to the registers it reads
+    assert hass.data[DOMAIN][entry.entry_id]["api"].subscriptions["txt113"] == 1
+
+    diagnostics = await async_get_config_entry_diagnostics(hass, entry)
+    assert diagnostics["entry"]["data"]["host"] == "**REDACTED**"
+    assert "127.0.0.1" not in json.dumps(diagnostics, default=str)
+    assert diagnostics["metrics"]["histograms"]["setup_time"]["count"] == 1
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_polling_stops_with_home_assistant(hass):
+    """Test the shared poll loop is a tracked task and stopping Home Assistant ends it and closes the session."""
+    entry = MockConfigEntry(domain=DOMAIN, data={"host": "http://127.0.0.1"})
+    entry.add_to_hass(hass)
+
+    with patch.object(IQR23, "load", _fake_load):
+        assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+    api = hass.data[DOMAIN][entry.entry_id]["api"]
+    api._getSession()
+    (scheduler,) = hass.data[DATA_SCHEDULERS].values()
+    assert scheduler._task in hass._background_tasks
+
+    hass.bus.async_fire(EVENT_HOMEASSISTANT_STOP)
+    await hass.async_block_till_done()
+    assert not hass.data[DATA_SCHEDULERS]
+    assert scheduler._task is None
+    assert api._session is None
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_polling_without_background_tasks(hass):
+    """Test cores older than background tasks poll in an untracked task that stopping ends."""
+    entry = MockConfigEntry(domain=DOMAIN, data={"host": "http://127.0.0.1"})
+    entry.add_to_hass(hass)
+
+    with patch.object(IQR23, "load", _fake_load), patch.object(
+        type(hass), "async_create_background_task", None
+    ):
+        assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+        (scheduler,) = hass.data[DATA_SCHEDULERS].values()
+        task = scheduler._task
+        assert task not in hass._tasks
+
+        hass.bus.async_fire(EVENT_HOMEASSISTANT_STOP)
+        await hass.async_block_till_done()
+    assert task.cancelled()
+    assert not hass.data[DATA_SCHEDULERS]
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_multiple_controllers(hass):
+    """Test two controllers get separate entities and old unique ids are migrated."""
+    first = MockConfigEntry(
+        domain=DOMAIN, unique_id="http://10.0.0.1", data={"host": "http://10.0.0.1"}
+    )
+    second = MockConfigEntry(
+        domain=DOMAIN, unique_id="http://10.0.0.2", data={"host": "http://10.0.0.2"}
+    )
+    first.add_to_hass(hass)
+    second.add_to_hass(hass)
+    registry = er.async_get(hass)
+    registry.async_get_or_create(
+        "sensor",
+        DOMAIN,
+        "iqr23_outdoorTemp",
+        config_entry=first,
+        suggested_object_id="old_outdoor",
+    )
+
+    with patch.object(IQR23, "load", _fake_load):
+        # setting up the integration sets up every entry
+        assert await hass.config_entries.async_setup(first.entry_id)
+        await hass.async_block_till_done()
+
+    assert (
+        registry.async_get_entity_id("sensor", DOMAIN, "iqr23_10.0.0.1_outdoorTemp")
+        == "sensor.old_outdoor"
+    )
+    assert (
+        registry.async_get_entity_id("sensor", DOMAIN, "iqr23_10.0.0.2_outdoorTemp")
+        is not None
+    )
+    assert set(hass.data[DOMAIN]) == {first.entry_id, second.entry_id}
+
+    assert await hass.config_entries.async_unload(first.entry_id)
+    assert await hass.config_entries.async_unload(second.entry_id)
+
+
+async def test_switch_is_optimistic(hass):
+    """Test a switch shows the requested mode at once and rolls back when the controller disagrees."""
+    entry = MockConfigEntry(domain=DOMAIN, data={"host": "http://127.0.0.1"})
+    entry.add_to_hass(hass)
+    applied = asyncio.Event()
+
+    async def set_mode(self, output, value):
+        # the controller ignores the command
+        await applied.wait()
+
+    with patch.object(IQR23, "load", _fake_load), patch.object(
+        IQR23, "setDigitalOutputMode", set_mode
+    ):
+        assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+        await hass.services.async_call(
+            "switch", "turn_off", {"entity_id": "switch.iq_r23_sp1"}, blocking=True
+        )
+        assert hass.states.get("switch.iq_r23_sp1").state == "off"
+
+        applied.set()
+        await hass.async_block_till_done()
+        assert hass.states.get("switch.iq_r23_sp1").state == "on"
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_warm_restart(hass, hass_storage):
+    """Test entities start from the persisted snapshot, marked stale until a poll succeeds."""
+    entry = MockConfigEntry(domain=DOMAIN, data={"host": "http://127.0.0.1"})
+    entry.add_to_hass(hass)
+    hass_storage[f"{DOMAIN}.{entry.entry_id}"] = {
+        "version": 1,
+        "minor_version": 1,
+        "key": f"{DOMAIN}.{entry.entry_id}",
+        "data": {
+            "loadtime": time() - 60,
+            "state": {"txt113": "-7.0", "col400": "1", "col403": "1"},
+        },
+    }
+    reachable = False
+
+    async def load(self, files=None):
+        if not reachable:
+            raise asyncio.TimeoutError
+        return await _fake_load(self, files)
+
+    with patch.object(IQR23, "load", load):
+        assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+        coordinator = hass.data[DOMAIN][entry.entry_id]["coordinator"]
+
+        state = hass.states.get("sensor.iq_r23_outdoor_teperature")
+        assert state.state == "-7.0"
+        assert state.attributes["stale"] is True
+        assert hass.states.get("switch.iq_r23_sp1").state == "on"
+
+        # the restored values outlive a failed poll
+        await coordinator.async_refresh()
+        assert hass.states.get("sensor.iq_r23_outdoor_teperature").state == "-7.0"
+
+        reachable = True
+        await coordinator.async_refresh()
+        state = hass.states.get("sensor.iq_r23_outdoor_teperature")
+        assert state.state == "-3.5"
+        assert "stale" not in state.attributes
+
+        async_fire_time_changed(
+            hass, dt_util.utcnow() + timedelta(seconds=STORAGE_SAVE_DELAY)
+        )
+        await hass.async_block_till_done()
+        assert (
+            hass_storage[f"{DOMAIN}.{entry.entry_id}"]["data"]["state"]["txt113"]
+            == "-3.5"
+        )
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_extra_registers(hass, hass_storage):
+    """Test registers enabled in the options become sensors using the cached catalog."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={"host": "http://127.0.0.1", "version": "R23 v2.41"},
+        options={CONF_EXTRA_REGISTERS: "txt600, col620"},
+    )
+    entry.add_to_hass(hass)
+    hass_storage[CATALOG_STORAGE_KEY] = {
+        "version": 1,
+        "minor_version": 1,
+        "key": CATALOG_STORAGE_KEY,
+        "data": {
+            "R23 v2.41": {
+                "version": "R23 v2.41",
+                "registers": {
+                    "txt600": ["data_n_zas", "float"],
+                    "col620": ["data_n_zas", "bool"],
+                },
+            }
+        },
+    }
+
+    async def load(self, files=None):
+        return await _fake_load(self, files, dict(STATE, txt600="48.5", col620="1"))
+
+    with patch.object(IQR23, "load", load):
+        assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+
+    assert hass.states.get("sensor.iq_r23_txt600").state == "48.5"
+    assert hass.states.get("binary_sensor.iq_r23_col620").state == "on"
+    assert "data_n_zas" in hass.data[DOMAIN][entry.entry_id]["api"].fileset
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
@@ -0,0 +1,731 @@
+"""Test the IQR23 client."""
+import asyncio
+import io
+import json
+from datetime import datetime, timedelta
+from time import time
+import os
+from unittest.mock import Mock, patch
+
+import aiohttp
+import pytest
+
+from custom_components.iqr23.iqr23 import (
+    BREAKER_BASE_DELAY,
+    BREAKER_PROBE_TIMEOUT,
+    BREAKER_THRESHOLD,
+    CircuitBreaker,
+    CircuitOpenError,
+    ClientClosed,
+    DeadlineExceeded,
+    FILE_RETRY_DELAY,
+    DIGITAL_OUTPUTS,
+    FILES,
+    IQR23,
+    PLAN,
+    Priority,
+    RegisterCatalog,
+    RequestScheduler,
+    SENSORS,
+    SETTINGS_FILES,
+    STALE_FACTOR,
+    Sensor,
+    StaggeredScheduler,
+    Superseded,
+    WANTED_KEYS,
+    _inflight,
+    _limiters,
+    parseXml,
+)
+from custom_components.iqr23.cli import FleetPoller
+from custom_components.iqr23.recording import (
+    Recording,
+    ReplayTransport,
+    ResponseRecorder,
+)
+
+from .fake_controller import FakeController
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+@pytest.fixture
+async def controller(socket_enabled):
+    """Run a fake controller on localhost."""
+    controller = await FakeController().start()
+    yield controller
+    await controller.close()
+
+
+def load_fixture(file):
+    """Return the raw body of a captured controller response."""
+    with open(os.path.join(FIXTURES, f"{file}.xml"), "rb") as f:
+        return f.read()
+
+
+def _decode(api, previous=None):
+    # the decode pass load() publishes, run on a state set up by hand
+    return api.plan.decode(api.state, api.loadtime, previous)
+
+
+def test_decode_snapshot():
+    """Test one decode pass covers every sensor and output."""
+    api = IQR23("127.0.0.1")
+    api.state = {
+        "txt113": "-3.5",
+        "txt104": "--.-",
+        "col202": "1",
+        "col400": "1",
+        "col403": "1",
+    }
+    api.loadtime = 100
+
+    snapshot = _decode(api)
+
+    assert snapshot.loadtime == 100
+    assert set(snapshot.sensors) == set(SENSORS)
+    assert set(snapshot.outputs) == set(DIGITAL_OUTPUTS)
+    assert snapshot.sensors["outdoorTemp"] == -3.5
+    assert snapshot.sensors["watertankPressure"] is True
+    assert snapshot.sensors["watertankUpper"] is None
+    assert snapshot.outputs["SP1"] == (True, "on")
+    assert snapshot.outputs["SP2"] == (False, None)
+
+
+async def test_discovery_primes_first_load(controller):
+    """Test the first load reuses the discovery response instead of fetching data.xml again."""
+    assert await IQR23.discovery(controller.host) == "R23 v2.41"
+    api = IQR23(controller.host)
+    await api.load(FILES)
+
+    assert controller.requests == [("GET", f"/{file}.xml") for file in FILES]
+    assert api.metrics.counters["primed"] == 1
+    assert api.snapshot.sensor("outdoorTemp") is not None
+    await api.close()
+
+
+async def test_close_drops_queued_mode_changes(controller):
+    """Test closing fails a queued mode change before it presses anything."""
+    api = IQR23(controller.host, command_window=0.5)
+    await api.load()
+    controller.requests.clear()
+    change = asyncio.ensure_future(api.setDigitalOutputMode("SP2", "on"))
+    await asyncio.sleep(0)
+
+    await api.close()
+
+    with pytest.raises(ClientClosed):
+        await change
+    await asyncio.sleep(0.6)
+    assert controller.requests == []
+    with pytest.raises(ClientClosed):
+        await api.loadFile("data")
+    with pytest.raises(ClientClosed):
+        await api.setDigitalOutputMode("SP2", "on")
+
+
+async def test_concurrent_reads_are_coalesced(socket_enabled):
+    """Test concurrent reads of a file share one request and the host limit holds for every client."""
+    controller = await FakeController(latency=0.05).start()
+    api = IQR23(controller.host)
+    other = IQR23(controller.host)
+
+    results = await asyncio.gather(
+        *(api.loadFile("data_i_all") for _ in range(3)),
+        *(IQR23.discovery(controller.host) for _ in range(2)),
+        other.loadFile("data_t_zas"),
+    )
+
+    assert results[0] is results[1] is results[2]
+    assert results[3] == results[4] == "R23 v2.41"
+    assert sorted(controller.requests) == [
+        ("GET", "/data.xml"),
+        ("GET", "/data_i_all.xml"),
+        ("GET", "/data_t_zas.xml"),
+    ]
+    assert api.metrics.counters["coalesced"] == 2
+    assert api.requests == 1
+    assert controller.peak == 1
+
+    await api.close()
+    await other.close()
+    await controller.close()
+
+
+async def test_host_limits_are_claimed_per_client():
+    """Test the largest claimed limit holds, is lowered only when idle and goes with the last client."""
+    host = "http://127.0.0.1:9"
+    api = IQR23(host)
+    wide = IQR23(host, max_concurrency=3)
+    assert api.limiter is wide.limiter
+    assert api.limiter.limit == 3
+
+    async with api.limiter.slot():
+        await wide.close()
+        # not lowered under a request in flight
+        assert api.limiter.limit == 3
+    assert api.limiter.limit == 1
+
+    await api.close()
+    await api.close()
+    assert host not in _limiters
+    # discovery leaves nothing behind either
+    assert await IQR23.discovery(host) is None
+    assert host not in _limiters and host not in _inflight
+
+
+async def test_scan_finds_controllers(controller):
+    """Test a network scan finds the controllers by their firmware version and nothing else."""
+    # the test sandbox only allows connections to 127.0.0.1
+    found = await IQR23.scan(["127.0.0.1/32"], port=controller.server.port)
+    assert found == {controller.host: "R23 v2.41"}
+
+    del controller.files["data"]["_accvers"]
+    assert await IQR23.scan(["127.0.0.1/32"], port=controller.server.port) == {}
+
+
+async def test_concurrent_load_merges_in_file_order():
+    """Test concurrent fetches finish out of order but merge deterministically."""
+    api = IQR23("127.0.0.1", max_concurrency=4)
+    running = 0
+    peak = 0
+
+    async def load_file(file):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01 * (len(FILES) - FILES.index(file)))
+        running -= 1
+        return {"shared": file, file: "1"}
+
+    api.loadFile = load_file
+    await api.load()
+
+    assert api.state["shared"] == FILES[-1]
+    assert all(api.state[file] == "1" for file in FILES)
+    assert set(api.file_timings) == set(FILES)
+    assert peak == len(FILES)
+
+
+def test_stream_parser_matches_xmltodict():
+    """Test the stream parser keeps exactly the wanted keys with identical values."""
+    state = dict()
+    for file in FILES:
+        body = load_fixture(file)
+        full = parseXml(body)
+        partial = parseXml(body, WANTED_KEYS)
+        assert partial == {k: v for k, v in full.items() if k in WANTED_KEYS}
+        state.update(partial)
+
+    api = IQR23("127.0.0.1")
+    api.state = state
+    snapshot = _decode(api)
+    assert None not in snapshot.sensors.values()
+    assert all(mode is not None for _, mode in snapshot.outputs.values())
+
+
+def test_decode_skips_parse_for_unchanged_registers():
+    """Test unchanged raw values reuse the previous conversion."""
+    api = IQR23("127.0.0.1")
+    api.state = {"txt113": "-3.5"}
+    first = _decode(api)
+
+    with patch.object(
+        PLAN, "parsers", [Mock(side_effect=AssertionError)] * len(PLAN.parsers)
+    ):
+        second = _decode(api, first)
+    assert second.values is first.values
+
+    api.state = {"txt113": "-3.0"}
+    assert _decode(api, second).sensors["outdoorTemp"] == -3.0
+
+
+def test_should_publish_deadband_and_interval():
+    """Test deadband and minimum publish interval of a float sensor."""
+    sensor = Sensor("txt1", float, deadband=0.5, publish_time=60)
+    now = datetime(2025, 1, 1, 12, 0)
+    recent = now - timedelta(seconds=10)
+    old = now - timedelta(seconds=120)
+    nan = float("NaN")
+
+    assert sensor.should_publish(20.0, 20.0, None, now)
+    assert not sensor.should_publish(20.0, 20.4, old, now)
+    assert sensor.should_publish(20.0, 20.6, old, now)
+    assert not sensor.should_publish(20.0, 20.6, recent, now)
+    assert sensor.should_publish(20.0, nan, old, now)
+    assert not sensor.should_publish(nan, float("NaN"), old, now)
+
+
+async def test_output_modes_are_batched(controller):
+    """Test concurrent mode changes share one master session and one verification read."""
+    api = IQR23(controller.host)
+    await api.load()
+    assert controller.mode("SP1") == "on"
+    changes = {"SP1": "on", "SP2": "on", "TVC": "off"}
+    controller.requests.clear()
+
+    await asyncio.gather(
+        *(api.setDigitalOutputMode(uid, mode) for uid, mode in changes.items())
+    )
+
+    assert all(controller.mode(uid) == mode for uid, mode in changes.items())
+    # login, two presses, logout and a verification read of data_i_all only
+    assert api.last_batch == {"requested": 3, "pressed": 2, "round_trips": 2 + 2 + 1}
+    assert controller.requests[-1] == ("GET", "/data_i_all.xml")
+    assert len(controller.requests) == api.last_batch["round_trips"]
+    assert controller.requests.count(("POST", "/login.html")) == 2
+    assert api.snapshot.outputs["TVC"] == (False, "off")
+    await api.close()
+
+
+async def test_reads_do_not_wait_for_the_controller(socket_enabled):
+    """Test reads return the current snapshot while a control sequence holds the controller."""
+    controller = await FakeController(latency=0.1).start()
+    api = IQR23(controller.host, command_window=0)
+    await api.load()
+    first = api.snapshot
+    assert first.version == 1
+
+    change = asyncio.ensure_future(api.setDigitalOutputMode("SP2", "on"))
+    await asyncio.sleep(0.05)
+    assert await asyncio.wait_for(api.getDigitalOutputMode("SP2"), 0.01) == "auto"
+    assert api.snapshot is first
+
+    newer = await api.waitForSnapshot(first.version, timeout=5)
+    await change
+    assert newer.version > first.version
+    assert newer.output("SP2")[1] == "on"
+    assert first.output("SP2")[1] == "auto"
+    await api.close()
+    await controller.close()
+
+
+async def test_concurrent_first_reads_share_one_load(controller):
+    """Test reads racing for the first snapshot all get it from a single load."""
+    api = IQR23(controller.host)
+
+    results = await asyncio.gather(*(api.getSensor("outdoorTemp") for _ in range(3)))
+
+    assert results == [results[0]] * 3 and results[0] is not None
+    assert controller.requests.count(("GET", "/data.xml")) == 1
+    await api.close()
+
+
+async def test_adaptive_file_polling(controller):
+    """Test unchanged files back off, changed files tighten and mode changes refresh settings."""
+    api = IQR23(controller.host, poll_intervals={"data": 5, "data_t_zas": 60})
+    assert await api.load() == FILES
+    now = api.loadtime
+
+    assert api.dueFiles(now + 5) == ("data", "data_i_all")
+    api.polls["data"].next = 0
+    await api.load(("data",))
+    assert api.polls["data"].interval == 10
+
+    controller.set_register("txt113", "-10.0")
+    await api.load(("data",))
+    assert api.polls["data"].interval == 5
+    assert api.state["txt113"] == "-10.0"
+
+    await api.setDigitalOutputMode("SP2", "on")
+    assert set(SETTINGS_FILES) <= set(api.dueFiles())
+    await api.close()
+
+
+async def test_staggered_polling_of_many_controllers(socket_enabled):
+    """Test the polls of 24 controllers are spread evenly over one interval."""
+    controllers = [await FakeController().start() for _ in range(24)]
+    clients = [IQR23(controller.host) for controller in controllers]
+    interval = 1.2
+    started = {}
+    loop = asyncio.get_running_loop()
+
+    def job(api):
+        async def poll():
+            started.setdefault(api.host, loop.time())
+            await api.loadIfRequired()
+
+        return poll
+
+    scheduler = StaggeredScheduler(interval)
+    for api in clients:
+        scheduler.add(api.host, job(api))
+    deadline = loop.time() + 3 * interval
+    while not all(api.state for api in clients) and loop.time() < deadline:
+        await asyncio.sleep(interval / 10)
+    for api in clients:
+        scheduler.remove(api.host)
+    await asyncio.sleep(0)
+
+    assert len(started) == len(clients)
+    assert all(api.state for api in clients)
+    phases = sorted(started.values())
+    gaps = [b - a for a, b in zip(phases, phases[1:])]
+    assert min(gaps) >= interval / len(clients) * 0.5
+
+    for api in clients:
+        await api.close()
+    for controller in controllers:
+        await controller.close()
+
+
+async def test_fleet_poller(socket_enabled):
+    """Test the fleet poller writes a JSON line per snapshot and serves OpenMetrics."""
+    controllers = [await FakeController().start() for _ in range(3)]
+    controllers[2].failing_files.update(FILES)
+    output = io.StringIO()
+    poller = FleetPoller(
+        [controller.host for controller in controllers], interval=0.3, output=output
+    )
+    await poller.start()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + 3
+    while (
+        len(poller.errors) < 1
+        or sum(api.snapshot is not None for api in poller.clients.values()) < 2
+    ):
+        assert loop.time() < deadline
+        await asyncio.sleep(0.05)
+
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert {record["host"] for record in records if "sensors" in record} == {
+        controllers[0].host,
+        controllers[1].host,
+    }
+    assert {record["host"] for record in records if "error" in record} == {
+        controllers[2].host
+    }
+    record = next(record for record in records if "sensors" in record)
+    assert set(record["sensors"]) == set(SENSORS)
+    assert record["outputs"]["SP1"] == {"on": True, "mode": "on"}
+
+    client = aiohttp.ClientSession()
+    await poller.serve("127.0.0.1", 0)
+    port = poller._runner.addresses[0][1]
+    async with client.get(f"http://127.0.0.1:{port}/metrics") as response:
+        assert response.headers["Content-Type"].startswith(
+            "application/openmetrics-text"
+        )
+        text = await response.text()
+    await client.close()
+    assert text.endswith("# EOF\n")
+    assert f'iqr23_up{{host="{controllers[2].host}"}} 0' in text
+    assert (
+        f'iqr23_output_mode{{host="{controllers[0].host}",output="SP1",iqr23_output_mode="on"}} 1'
+        in text
+    )
+    assert f'iqr23_sensor{{host="{controllers[0].host}",sensor="outdoorTemp"}}' in text
+
+    await poller.stop()
+    for controller in controllers:
+        await controller.close()
+
+
+async def test_metrics(socket_enabled):
+    """Test fetch, parse, lock and error metrics are recorded per file."""
+    controller = await FakeController(failing_files=("data_n_txo",)).start()
+    api = IQR23(controller.host)
+
+    assert await api.loadIfRequired() == ("data", "data_i_all", "data_t_zas")
+
+    metrics = api.metrics.as_dict()
+    assert metrics["counters"]["bytes.data"] > 0
+    assert metrics["counters"]["errors.data_n_txo"] == 1
+    assert metrics["counters"]["partial_loads"] == 1
+    assert metrics["histograms"]["fetch_time.data"]["count"] == 1
+    assert metrics["histograms"]["parse_time.data"]["buckets"]["+Inf"] == 1
+    assert metrics["histograms"]["lock_wait"]["count"] == 1
+
+    await api.close()
+    await controller.close()
+
+
+async def test_circuit_breaker(controller):
+    """Test repeated failures open the circuit and one successful probe closes it."""
+    api = IQR23(controller.host)
+    controller.failing_files.update(FILES)
+
+    for _ in range(BREAKER_THRESHOLD):
+        with pytest.raises(aiohttp.ClientError):
+            await api.load(FILES)
+    assert api.breaker.state == CircuitBreaker.OPEN
+    assert (
+        BREAKER_BASE_DELAY * 0.8
+        <= api.breaker.retry_at - time()
+        <= BREAKER_BASE_DELAY * 1.2
+    )
+
+    requests = len(controller.requests)
+    with pytest.raises(CircuitOpenError):
+        await api.load(FILES)
+    assert len(controller.requests) == requests
+
+    # a failed probe opens it again for twice as long
+    api.breaker.retry_at = 0
+    with pytest.raises(aiohttp.ClientError):
+        await api.load(FILES)
+    assert api.breaker.opened == 2
+
+    # a cancelled probe does not leave the circuit half open for good
+    controller.failing_files.clear()
+    controller.latency = 1
+    api.breaker.retry_at = 0
+    probe = asyncio.ensure_future(api.load(FILES))
+    await asyncio.sleep(0.1)
+    assert api.breaker.state == CircuitBreaker.HALF_OPEN
+    assert not api.breaker.allow(time())
+    # a probe hanging past its timeout gives way to another
+    assert api.breaker.allow(time() + BREAKER_PROBE_TIMEOUT)
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+    assert api.breaker.state == CircuitBreaker.OPEN
+    assert api.breaker.allow(time())
+    api.breaker.state = CircuitBreaker.OPEN
+    api.breaker.retry_at = 0
+
+    controller.latency = 0
+    assert await api.load(FILES) == FILES
+    assert api.breaker.state == CircuitBreaker.CLOSED
+    assert api.metrics.counters["circuit_rejected"] == 1
+    await api.close()
+
+
+async def test_request_scheduler_priorities():
+    """Test tickets are granted by priority, superseded by key and dropped at their deadline."""
+    scheduler = RequestScheduler()
+    loop = asyncio.get_running_loop()
+    assert scheduler.request(Priority.POLL).done()
+
+    old_poll = scheduler.request(Priority.POLL, key="poll")
+    poll = scheduler.request(Priority.POLL, key="poll")
+    late = scheduler.request(Priority.POLL, deadline=loop.time() + 0.01)
+    verify = scheduler.request(Priority.VERIFY)
+    control = scheduler.request(Priority.CONTROL)
+    with pytest.raises(Superseded):
+        await old_poll
+    with pytest.raises(DeadlineExceeded):
+        await late
+    assert len(scheduler) == 3
+
+    for ticket in (control, verify, poll):
+        scheduler.release()
+        assert ticket.done()
+    scheduler.release()
+    assert scheduler.request(Priority.POLL).done()
+
+
+async def test_control_overtakes_queued_polls(socket_enabled):
+    """Test a mode change goes ahead of polls queued behind a running one."""
+    controller = await FakeController(latency=0.02).start()
+    api = IQR23(controller.host, command_window=0)
+    await api.load(FILES)
+    controller.requests.clear()
+
+    polls = []
+    for _ in range(5):
+        api.forceFiles(FILES)
+        polls.append(asyncio.ensure_future(api.loadIfRequired()))
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.01)
+    await api.setDigitalOutputMode("SP2", "on")
+    results = await asyncio.gather(*polls)
+
+    # the running poll finishes, three queued ones are superseded, the last one runs after the control
+    assert [bool(result) for result in results] == [True, False, False, False, True]
+    assert api.metrics.counters["polls_dropped"] == 3
+    login = controller.requests.index(("POST", "/login.html"))
+    assert controller.requests[:login] == [("GET", f"/{file}.xml") for file in FILES]
+    assert controller.requests[login + 3] == ("GET", "/data_i_all.xml")
+    # files are picked when the poll gets its turn, only the settings forced by the mode change are left
+    assert controller.requests[login + 4 :] == [
+        ("GET", f"/{file}.xml") for file in SETTINGS_FILES
+    ]
+    await api.close()
+    await controller.close()
+
+
+async def test_register_catalog(controller):
+    """Test the catalog covers every file and extra registers get decoded from their file."""
+    api = IQR23(controller.host)
+    catalog = await api.buildCatalog()
+
+    assert catalog.version == "R23 v2.41"
+    assert catalog.fileOf("txt600") == "data_n_zas"
+    assert catalog.registers["col400"] == ("data_i_all", "bool")
+    assert catalog.registers["txt600"][1] == "float"
+    assert catalog.registers["txt614"][1] == "str"
+    restored = RegisterCatalog.from_dict(json.loads(json.dumps(catalog.as_dict())))
+    assert restored.registers == catalog.registers
+
+    api.catalog = restored
+    api.addRegisters(["txt600", "txt9999"])
+    assert api.fileset == (
+        "data",
+        "data_i_all",
+        "data_t_zas",
+        "data_n_zas",
+        "data_n_txo",
+    )
+    assert "txt9999" not in api.sensors
+    await api.load()
+    assert api.snapshot.sensor("txt600") == float(controller.register("txt600"))
+    assert api.filesFor(["col400", "txt600"]) == ("data_i_all", "data_n_zas")
+    await api.close()
+
+
+async def test_subscriptions_plan_the_fetched_files(controller):
+    """Test only files holding subscribed registers are polled."""
+    api = IQR23(controller.host)
+    assert api.plannedFiles() == FILES
+    await api.load()
+    tank = set(api.files["data_t_zas"])
+    keys = [sensor.name for sensor in SENSORS.values() if sensor.name not in tank]
+    unsubscribe = api.subscribe(keys)
+    output = api.subscribe(["col400", "col403"])
+    assert "data_t_zas" not in api.plannedFiles()
+
+    api.forceFiles(FILES)
+    controller.requests.clear()
+    await api.load()
+    assert ("GET", "/data_t_zas.xml") not in controller.requests
+    assert len(controller.requests) == len(api.plannedFiles())
+
+    unsubscribe()
+    assert api.plannedFiles() == ("data_i_all",)
+    output()
+    assert api.plannedFiles() == ()
+    await api.close()
+
+
+@pytest.mark.parametrize("etag", [False, True])
+async def test_unchanged_responses_are_not_parsed(socket_enabled, etag):
+    """Test unchanged files reuse the previous parse, through ETags where the server sends them."""
+    controller = await FakeController(etag=etag).start()
+    api = IQR23(controller.host)
+    await api.load(FILES)
+
+    controller.set_register("txt113", "-10.0")
+    with patch("custom_components.iqr23.iqr23.parseXml", wraps=parseXml) as parse:
+        await api.load(FILES)
+    assert parse.call_count == 1
+    assert api.snapshot.sensor("outdoorTemp") == -10.0
+    tank_bytes = api.metrics.counters["bytes.data_t_zas"]
+
+    unchanged = api.snapshot
+    await api.load(FILES)
+    assert api.state is unchanged.state
+    assert api.snapshot.values is unchanged.values
+    assert api.snapshot.loadtime >= unchanged.loadtime
+    assert api.metrics.counters["parses_skipped"] == 2 * len(FILES) - 1
+    assert api.metrics.ratio("parses_skipped", "responses") == round(100 * 7 / 12, 1)
+    # a 304 carries no body
+    assert (api.metrics.counters["bytes.data_t_zas"] == tank_bytes) == etag
+    await api.close()
+    await controller.close()
+
+
+async def test_failing_file_keeps_its_data_and_goes_stale(controller):
+    """Test a failing file is retried on its own and only its registers go stale."""
+    api = IQR23(controller.host)
+    await api.load(FILES)
+    assert api.snapshot.stale_files == frozenset()
+    controller.failing_files.add("data_n_txo")
+    controller.set_register("txt113", "-10.0")
+
+    now = time()
+    assert await api.load(FILES) == ("data", "data_i_all", "data_t_zas")
+    assert api.snapshot.sensor("outdoorTemp") == -10.0
+    assert "data_n_txo" in api.files
+    assert (
+        now + FILE_RETRY_DELAY
+        <= api.polls["data_n_txo"].next
+        <= time() + FILE_RETRY_DELAY
+    )
+    assert api.polls["data_t_zas"].next > api.polls["data_n_txo"].next
+
+    api.file_loadtimes["data_n_txo"] -= (
+        STALE_FACTOR * api.polls["data_n_txo"].max_interval + 1
+    )
+    await api.load(("data",))
+    assert api.snapshot.stale_files == {"data_n_txo"}
+
+    controller.failing_files.clear()
+    await api.load(("data_n_txo",))
+    assert api.snapshot.stale_files == frozenset()
+    assert api.polls["data_n_txo"].failures == 0
+    await api.close()
+
+
+async def test_restored_values_outlive_a_failing_file(controller):
+    """Test registers of a file failing after a restart keep their restored values until it is fetched."""
+    api = IQR23(controller.host)
+    api.restore(
+        {
+            "loadtime": time() - 60,
+            "state": {"txt113": "-7.0", "txt520": "31.0", "txt521": "40%"},
+        }
+    )
+    controller.failing_files.add("data_n_txo")
+
+    assert await api.load(FILES) == ("data", "data_i_all", "data_t_zas")
+    assert api.snapshot.restored
+    assert api.snapshot.sensor("outdoorTemp") == 6.6
+    assert api.snapshot.sensor("lowerFloorRequest") == 31.0
+    assert api.snapshot.sensor("lowerFloorMixing") == 40
+
+    controller.failing_files.clear()
+    await api.load(("data_n_txo",))
+    assert not api.snapshot.restored
+    assert api.snapshot.sensor("lowerFloorRequest") == float(
+        controller.register("txt520")
+    )
+    await api.close()
+
+
+async def test_record_and_replay(controller, tmp_path):
+    """Test recorded responses replay into a client without the controller."""
+    recorder = ResponseRecorder(str(tmp_path))
+    api = IQR23(controller.host, recorder=recorder)
+    await api.load(FILES)
+    first = api.loadtime
+    controller.set_register("txt113", "-12.5")
+    await api.load(FILES)
+    await recorder.close()
+    await api.close()
+
+    recording = Recording(str(tmp_path))
+    records = list(recording.records())
+    assert [file for _, file, _ in records] == list(FILES) * 2
+    assert {timestamp for timestamp, _, _ in records} == {first, api.loadtime}
+    # unchanged responses are stored once and read back in full
+    assert records[5][2] == records[1][2]
+    assert (
+        os.path.getsize(recording.segments[0][1])
+        < sum(len(body) for _, _, body in records) / 4
+    )
+    assert [file for _, file, _ in recording.records(since=api.loadtime)] == list(FILES)
+
+    # a time index seeks over segments, old ones are dropped
+    small = ResponseRecorder(str(tmp_path / "small"), segment_bytes=1, keep=3)
+    spread = [
+        (first + index, file, body) for index, (_, file, body) in enumerate(records)
+    ]
+    for timestamp, file, body in spread:
+        small.append(file, body, timestamp)
+    await small.close()
+    assert len(Recording(str(tmp_path / "small")).segments) == 3
+    assert (
+        list(Recording(str(tmp_path / "small")).records(since=first + 6)) == spread[-2:]
+    )
+
+    transport = ReplayTransport(recording, speed=None)
+    replayed = IQR23("replay", transport=transport)
+    assert await transport.play(replayed) == 2
+    assert replayed.snapshot.sensor("outdoorTemp") == -12.5
+    assert replayed.metrics.counters["parses_skipped"] == 3
+
+    # read by polling, the replay clock is still at the first cycle
+    polled = IQR23("replay", transport=ReplayTransport(recording, speed=1))
+    await polled.load(FILES)
+    assert polled.snapshot.sensor("outdoorTemp") == 6.6